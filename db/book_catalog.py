@@ -0,0 +1,57 @@
+"""
+This file contains the in-memory catalog of the books metadata.
+"""
+
+import collections
+
+import db.sql_queries as queries
+from utils.constants import DATE_FORMAT
+
+# The metadata of a book in the catalog. The date is formatted with DATE_FORMAT.
+CatalogBook = collections.namedtuple("CatalogBook", ["title", "author", "path", "size", "date"])
+
+
+class BookCatalog:
+    """
+    In-memory cache of the metadata of all the books in a database.
+    It is loaded on the first lookup after it was invalidated, so the lookups are dictionary reads.
+    """
+
+    def __init__(self, db):
+        """
+        :param db: The database of the books
+        """
+        self._db = db
+        self._books = None  # Maps book ids to their metadata. None when the catalog needs to be loaded.
+
+    def invalidate(self):
+        """ Mark the catalog as outdated, so it will be loaded again on the next lookup. """
+        self._books = None
+
+    def refresh(self):
+        """ Load the metadata of all the books from the database. """
+        self._books = {book_id: CatalogBook(title, author, path, size, date)
+                       for book_id, title, author, path, size, date
+                       in self._db.execute(queries.ALL_BOOKS, (DATE_FORMAT,)).fetchall()}
+
+    @property
+    def books(self):
+        """ Dict that maps the book ids to their metadata """
+        if self._books is None:
+            self.refresh()
+        return self._books
+
+    def get(self, book_id):
+        """
+        Get the metadata of a book.
+        :param book_id: The book id of the book
+        :return: The book metadata, or None if there is no such book
+        """
+        return self.books.get(book_id)
+
+    def all_books(self):
+        """
+        Get a list of all the books.
+        :return: The list of books, as (book_id, title, author, path, size, date) tuples
+        """
+        return [(book_id,) + book for book_id, book in self.books.items()]
@@ -1,13 +1,23 @@
-import functools
+import array
+import collections
+import itertools
+import multiprocessing
 import os
 import re
 
 import db.sql_queries as queries
+from db.book_catalog import BookCatalog
 from db.db_manager import Database
 from db.exceptions import CheckError
-from db.query_builder import build_query
-from utils.book_parser import parse_book
+from db.index_advisor import IndexAdvisor
+from db.postings import PostingEncoder, decode_positions
+from db.query_builder import build_query, build_count_query, build_where, to_filter, Equals, In, MemberOf
+from db.trigrams import INDEXED_COLUMNS, use_trigram_index
+from utils.book_parser import BookParser, COLUMN_TYPECODE, batch_appearances, parse_book_batches, \
+    parse_book_parallel
 from utils.constants import VALID_WORD_REGEX, DATE_FORMAT
+from utils.phrase_matcher import PhraseMatcher
+from utils.utils import CompleteLinesReader, bounded_imap, file_hash, find_encoding
 
 
 class BookDatabase(Database):
@@ -16,8 +26,56 @@ class BookDatabase(Database):
     It is the python interface to perform actions on the books database.
     """
 
-    # Cache size for get_word_id
-    WORD_IDS_CACHE_SIZE = 1000
+    # The number of parsed books which can wait for insertion in add_many_books, per worker process
+    PENDING_BOOKS_PER_PROCESS = 2
+
+    # Books files bigger than this size (in bytes) are parsed in parallel by add_book
+    PARALLEL_PARSE_MIN_SIZE = 64 * 1024 * 1024
+
+    # The version of the schema created by the initialize_schema script.
+    # Databases with an older version are upgraded by the migrate_to_v<version> scripts, one version at a time.
+    SCHEMA_VERSION = 7
+
+    # The first schema version with the phrase matches table, which has to be filled when migrating to it
+    PHRASE_MATCH_SCHEMA_VERSION = 4
+
+    # The first schema version with the books statistics table, which has to be filled when migrating to it
+    BOOK_STATISTICS_SCHEMA_VERSION = 5
+
+    # The first schema version with the trigram index, which has to be filled when migrating to it
+    TRIGRAM_SCHEMA_VERSION = 6
+
+    # The first schema version with the books vocabulary table, which has to be filled when migrating to it
+    BOOK_VOCABULARY_SCHEMA_VERSION = 7
+
+    # Columns of the book table which may be missing in databases created by older versions
+    BOOK_NEW_COLUMNS = {
+        "file_mtime": "file_mtime REAL",
+        "file_hash": "file_hash TEXT"
+    }
+
+    # The name of the setting which stores if the word appearances are stored as compressed postings
+    COMPRESSED_STORAGE_SETTING = "compressed_storage"
+
+    # The names of the tables the appearances queries run on, in each storage mode
+    APPEARANCES_TABLE = "word_appearance"
+    DECODED_APPEARANCES_TABLE = "decoded_appearance_{number}"
+
+    # The number of decoded appearances tables kept, so the queries of different postings don't evict each other
+    DECODED_TABLES_CACHE_SIZE = 4
+
+    # The table the appearances of a single book are decoded into, before the ones matching the filters are kept
+    DECODED_BOOK_TABLE = "decoded_book_appearance"
+    POSTINGS_TABLE = "word_posting"
+
+    # The name of the table of the distinct words of every book, in both storage modes
+    VOCABULARY_TABLE = "book_word"
+
+    # Filter of book_id / word_id, which matches all the ids
+    ALL_IDS_FILTER = "> 0"
+
+    # The parts of the books which have statistics of their own
+    STATISTICS_PARTS = ("paragraph", "line", "sentence")
 
     VALID_MULTIPLE_WORDS = rf"{VALID_WORD_REGEX}(\W+{VALID_WORD_REGEX})*"
     INVALID_GROUP_NAMES = ["None", "All"]  # These names can't be used as a group name
@@ -27,18 +85,34 @@ class BookDatabase(Database):
     APPEARANCES_ORDER = "COUNT(word_index)"
     LENGTH_ORDER = "length"
 
+    # The expressions of the unique words searches which the postings answer without decoding them,
+    # mapped to their equivalents on the postings
+    POSTINGS_EXPRESSIONS = {APPEARANCES_ORDER: "SUM(appearances_count)"}
+
+    # Matches the columns of the word appearances which are only stored encoded in the postings
+    POSITION_COLUMNS_REGEX = re.compile(
+        r"\b(word_index|paragraph|line|line_index|line_offset|sentence|sentence_index)\b")
+
+    # The unique keys to page the search results by
+    BOOKS_PAGE_KEYS = ("book_id",)
+    APPEARANCES_PAGE_KEYS = ("book_id", "word_index")
+
     # Script names
     class SCRIPTS:
         INITIALIZE_SCHEMA = "initialize_schema"
-        SEARCH_PHRASE = "search_phrase"
+        MIGRATE_SCHEMA = "migrate_to_v{version}"
 
     #
     # Initializations Functions
     #
 
     def __init__(self, **kargs):
+        self.catalog = BookCatalog(self)  # The books metadata cache
+        self.index_advisor = IndexAdvisor(self)  # Advises indexes for the dynamically built queries
         super().__init__(**kargs)
-        self.book_insert_callbacks = []
+
+        # The catalog is refreshed first, so the other callbacks will see the new books
+        self.book_insert_callbacks = [self.catalog.refresh]
         self.group_insert_callbacks = []
         self.group_word_insert_callbacks = []
         self.phrase_insert_callbacks = []
@@ -47,11 +121,263 @@ class BookDatabase(Database):
         """ Initialize the db with the books schema. """
         self._run_sql_script(BookDatabase.SCRIPTS.INITIALIZE_SCHEMA, multiple_statements=True)
 
+    def _add_missing_columns(self):
+        """ Add the columns that are missing in databases created by older versions. """
+        book_columns = {name for name, in self.execute(queries.BOOK_COLUMNS)}
+        for column, column_definition in BookDatabase.BOOK_NEW_COLUMNS.items():
+            if column not in book_columns:
+                self.execute(queries.ADD_BOOK_COLUMN.format(column=column_definition))
+
+    def _migrate_schema(self):
+        """
+        Upgrade the schema of a db created by an older version, in place.
+        :return: The schema version of the db before the upgrade
+        """
+        self._add_missing_columns()
+
+        # The original schema didn't set the version, so it is treated as version 1
+        version = max(self.execute(queries.SCHEMA_VERSION).fetchone()[0], 1)
+        for next_version in range(version + 1, BookDatabase.SCHEMA_VERSION + 1):
+            self._run_sql_script(BookDatabase.SCRIPTS.MIGRATE_SCHEMA.format(version=next_version),
+                                 multiple_statements=True)
+        return version
+
     def new_connection(self, always_create=False, new_path=None, commit=True):
-        if not super().new_connection(always_create, new_path, commit):
-            # Only if a new connection was created
+        if super().new_connection(always_create, new_path, commit):
+            # Only if connected to an existing db
+            old_version = self._migrate_schema()
+        else:
             self._initialize_schema()
-        self.get_word_id.cache_clear()
+            old_version = BookDatabase.SCHEMA_VERSION
+        self._load_vocabulary()
+        self._load_storage_mode()
+        self.catalog.invalidate()
+        self.index_advisor.clear()
+
+        # The phrase matches, the statistics, the trigrams and the vocabularies of a db from before their tables
+        # are calculated once
+        if old_version < BookDatabase.PHRASE_MATCH_SCHEMA_VERSION:
+            self.update_phrase_matches()
+        if old_version < BookDatabase.BOOK_STATISTICS_SCHEMA_VERSION:
+            self.update_books_statistics()
+        if old_version < BookDatabase.TRIGRAM_SCHEMA_VERSION:
+            self.update_trigrams()
+        if old_version < BookDatabase.BOOK_VOCABULARY_SCHEMA_VERSION:
+            self.update_books_vocabulary()
+
+    def reader(self):
+        db_reader = super().reader()
+
+        # The reader is used from another thread, so it gets its own caches, which read from its own connection.
+        # Its queries aren't recorded, since the index advisor advises the queries of this connection.
+        db_reader.catalog = BookCatalog(db_reader)
+        db_reader.index_advisor = None
+        db_reader.word_ids = dict(self.word_ids)
+        db_reader.word_names = dict(self.word_names)
+        db_reader._load_storage_mode()
+        return db_reader
+
+    def rollback(self):
+        super().rollback()
+
+        # The in-memory caches may hold rows that were rolled back
+        self._load_vocabulary()
+        self._load_storage_mode()
+        self.catalog.invalidate()
+
+    #
+    # Vocabulary Functions
+    #
+
+    def _load_vocabulary(self):
+        """ Load all the words of the database into the in-memory vocabulary. """
+        self.word_ids = dict(self.execute(queries.ALL_WORD_NAMES_AND_IDS))  # Maps word name to word id
+        self.word_names = {word_id: name for name, word_id in self.word_ids.items()}  # Maps word id to word name
+        self.next_word_id = max(self.word_names, default=0) + 1  # The word id to give to the next new word
+
+    def _add_to_vocabulary(self, word_ids):
+        """
+        Add new words to the in-memory vocabulary.
+        :param word_ids: Dict that maps the new word names to their word ids
+        """
+        self.word_ids.update(word_ids)
+        self.word_names.update((word_id, name) for name, word_id in word_ids.items())
+        self.next_word_id = max(self.next_word_id, max(word_ids.values(), default=0) + 1)
+
+    #
+    # Trigram Index Functions
+    #
+
+    def _insert_trigrams(self, table, id_filter=ALL_IDS_FILTER):
+        """
+        Insert the trigrams of the indexed columns of a table.
+        :param table: The table of the indexed columns
+        :param id_filter: Filter of the id column of the table, which matches the rows to index
+        """
+        for (indexed_table, column), (source, id_column) in INDEXED_COLUMNS.items():
+            if indexed_table == table:
+                self.execute(queries.INSERT_TEXT_TRIGRAMS.format(table=table, column=column, id_column=id_column,
+                                                                 id_filter=id_filter),
+                             (source,))
+
+    def _insert_words_trigrams(self, word_ids):
+        """
+        Insert the trigrams of new words.
+        :param word_ids: Iterable of the word ids of the words
+        """
+        word_ids = list(word_ids)
+        if word_ids:
+            self._insert_trigrams("word", f"BETWEEN {int(min(word_ids))} AND {int(max(word_ids))}")
+
+    def update_trigrams(self):
+        """ Build again the trigram index of all the word names, book titles and book authors. """
+        self.execute(queries.DELETE_ALL_TEXT_TRIGRAMS)
+        self._insert_trigrams("word")
+        self._insert_trigrams("book")
+
+    #
+    # Compressed Storage Functions
+    #
+
+    def _load_storage_mode(self):
+        """ Load the storage mode of the word appearances from the database settings. """
+        setting = self.execute(queries.SETTING, (BookDatabase.COMPRESSED_STORAGE_SETTING,)).fetchone()
+        self.compressed_storage = bool(setting and setting[0])
+        # Maps the connection and the filters of the decoded postings to their table
+        self._decoded_tables = collections.OrderedDict()
+
+    def use_compressed_storage(self, compressed=True):
+        """
+        Switch the storage mode of the word appearances, converting all the existing appearances.
+        In the compressed storage, all the appearances of a word in a book are stored as a single posting blob,
+        which takes several times less space than the appearance rows.
+        The appearances queries decode only the postings they need.
+        :param compressed: True to store the appearances as postings, False to store them as rows
+        """
+        if compressed == self.compressed_storage:
+            return
+
+        if compressed:
+            for book_id, in self.execute(queries.ALL_BOOK_IDS).fetchall():
+                self._insert_postings(self.execute(queries.BOOK_APPEARANCES, (book_id,)).fetchall())
+            self.execute(queries.DELETE_ALL_APPEARANCES)
+        else:
+            # Decode a single book at a time, so the whole corpus is never decoded at once
+            for book_id, in self.execute(queries.ALL_BOOK_IDS).fetchall():
+                self.execute(queries.COPY_DECODED_APPEARANCES.format(decoded_table=self._decode_postings(book_id)))
+            self.execute(queries.DELETE_ALL_POSTINGS)
+
+        self.execute(queries.REPLACE_SETTING, (BookDatabase.COMPRESSED_STORAGE_SETTING, int(compressed)))
+        self.compressed_storage = compressed
+        self._decoded_tables.clear()
+
+    def _insert_postings(self, word_id_appearances):
+        """
+        Encode word appearances into the postings of their words, continuing the existing postings.
+        :param word_id_appearances: Iterable of words appearances in the form of:
+            (book_id, word_id, word_index, paragraph, line, line_index, line_offset, sentence, sentence_index).
+            The appearances of every word in a book must be ordered by word_index,
+            and come after the appearances already stored.
+        """
+        encoders = {}
+        for book_id, word_id, *position in word_id_appearances:
+            encoder = encoders.get((book_id, word_id))
+            if encoder is None:
+                posting = self.execute(queries.WORD_POSTING, (book_id, word_id)).fetchone()
+                encoder = encoders[book_id, word_id] = PostingEncoder(posting[0] if posting else b"")
+            encoder.add(position)
+
+        self.executemany(queries.REPLACE_WORD_POSTING,
+                         ((book_id, word_id, encoder.count, encoder.blob)
+                          for (book_id, word_id), encoder in encoders.items()))
+        self._decoded_tables.clear()
+
+    def _decode_postings(self, book_id=None, word_ids=None, position_filters=None):
+        """
+        Decode the postings matching the given filters into a decoded appearances table.
+        The last DECODED_TABLES_CACHE_SIZE tables are kept, and a table which already holds the same postings is
+        used as is. Otherwise, the least recently used table is replaced.
+        Without a book or words filter, the postings are decoded book by book, so only the appearances matching the
+        position filters of all the books are held at once.
+        :param book_id: The book id of the postings to decode. Keep as None for all the books.
+        :param word_ids: Iterable of the word ids of the postings to decode. Keep as None for all the words.
+        :param position_filters: Dict that maps the position columns to their filters, as in build_query.
+            Only the appearances matching them are kept. Keep as None for all the appearances.
+        :return: The name of the table
+        """
+        word_ids = tuple(word_ids) if word_ids is not None else None
+        where, where_params = build_where(position_filters or {})
+        decoded_filters = (self._conn, book_id, word_ids, where, where_params)
+        decoded_table = self._decoded_tables.get(decoded_filters)
+        if decoded_table is not None:
+            self._decoded_tables.move_to_end(decoded_filters)
+            return decoded_table
+
+        if len(self._decoded_tables) < BookDatabase.DECODED_TABLES_CACHE_SIZE:
+            decoded_table = BookDatabase.DECODED_APPEARANCES_TABLE.format(number=len(self._decoded_tables))
+        else:
+            _old_filters, decoded_table = self._decoded_tables.popitem(last=False)
+
+        self.execute(queries.CREATE_DECODED_APPEARANCE.format(decoded_table=decoded_table))
+        self.execute(queries.CREATE_DECODED_APPEARANCE_LOCATION.format(decoded_table=decoded_table))
+        self.execute(queries.CLEAR_DECODED_APPEARANCE.format(decoded_table=decoded_table))
+
+        # The appearances are filtered after they are decoded, so they are decoded into a table of their own first
+        insert_table = BookDatabase.DECODED_BOOK_TABLE if where else decoded_table
+        self.execute(queries.CREATE_DECODED_APPEARANCE.format(decoded_table=insert_table))
+
+        book_ids = [book_id] if book_id is not None or word_ids is not None else \
+            [book_id for book_id, in self.execute(queries.ALL_BOOK_IDS).fetchall()]
+        word_id_filter = BookDatabase.ALL_IDS_FILTER if word_ids is None else \
+            f"IN ({', '.join(str(int(word_id)) for word_id in word_ids)})"
+        for postings_book_id in book_ids:
+            postings = self.execute(queries.FILTERED_POSTINGS.format(book_id_filter=self._id_filter(postings_book_id),
+                                                                     word_id_filter=word_id_filter)).fetchall()
+            self.executemany(queries.INSERT_DECODED_APPEARANCE.format(decoded_table=insert_table),
+                             ((word_id, posting_book_id) + position
+                              for word_id, posting_book_id, positions in postings
+                              for position in decode_positions(positions)))
+            if where:
+                self.execute(queries.COPY_FILTERED_DECODED_APPEARANCES.format(decoded_table=decoded_table,
+                                                                              source_table=insert_table,
+                                                                              where=where), where_params)
+                self.execute(queries.CLEAR_DECODED_APPEARANCE.format(decoded_table=insert_table))
+
+        self._decoded_tables[decoded_filters] = decoded_table
+        return decoded_table
+
+    @staticmethod
+    def _id_filter(object_id=None):
+        """
+        Create a filter of a book_id / word_id column, to be formatted into a query.
+        :param object_id: The id to filter by. Keep as None for all the ids.
+        :return: The filter
+        """
+        return BookDatabase.ALL_IDS_FILTER if object_id is None else f"== {int(object_id)}"
+
+    def _appearances_table(self, book_id=None, word_ids=None, position_filters=None):
+        """
+        Get the table to query the word appearances from, in the current storage mode.
+        In the compressed storage, the postings matching the given filters are decoded into a temporary table.
+        :param book_id: The book id of the needed appearances. Keep as None for all the books.
+        :param word_ids: Iterable of the word ids of the needed appearances. Keep as None for all the words.
+        :param position_filters: Dict that maps the position columns to the filters of the needed appearances.
+            Keep as None for all the appearances.
+        :return: The name of the table
+        """
+        if not self.compressed_storage:
+            return BookDatabase.APPEARANCES_TABLE
+
+        return self._decode_postings(book_id, word_ids, position_filters)
+
+    def _delete_book_appearances(self, book_id):
+        """
+        Delete all the word appearances of a book, in both storage modes.
+        :param book_id: The book id of the book
+        """
+        self.execute(queries.DELETE_BOOK_APPEARANCES, (book_id,))
+        self.execute(queries.DELETE_BOOK_POSTINGS, (book_id,))
+        self._decoded_tables.clear()
 
     #
     # Callbacks Functions
@@ -124,7 +450,7 @@ class BookDatabase(Database):
     # Database Insertion Functions
     #
 
-    def insert_book(self, title, author, path, size, date):
+    def insert_book(self, title, author, path, size, date, mtime=None, content_hash=None):
         """
         Insert a book to the database.
         :param title: Title of the book
@@ -132,36 +458,70 @@ class BookDatabase(Database):
         :param path: The path to the file containing the book text
         :param size: The size of the book file
         :param date: A date related to the book to store (publish / file date)
+        :param mtime: The modification time of the book file, if known
+        :param content_hash: The hash of the book file, if known
         :return: The book id of the newly inserted book
         """
-        return self.execute(queries.INSERT_BOOK,
-                            (self.to_title(title), self.to_title(author), path, size, date)).lastrowid
+        book_id = self.execute(queries.INSERT_BOOK,
+                               (self.to_title(title), self.to_title(author), path, size, date, mtime, content_hash)
+                               ).lastrowid
+        self._insert_trigrams("book", self._id_filter(book_id))
+        self.catalog.invalidate()
+        return book_id
+
+    def update_book_fingerprint(self, book_id, size, mtime, content_hash):
+        """
+        Update the fingerprint of a book file, after its content was parsed again.
+        :param book_id: The book id of the book
+        :param size: The size of the book file
+        :param mtime: The modification time of the book file
+        :param content_hash: The hash of the book file, or None if it isn't known
+        """
+        self.execute(queries.UPDATE_BOOK_FINGERPRINT, (size, mtime, content_hash, book_id))
+        self.catalog.invalidate()
 
     def insert_word(self, word):
         """
         Insert a word to the database (if it doesn't exists already).
         :param word: The word string to insert. Assumed to be a valid single word.
-        :return: The word id of the newly inserted word
+        :return: The word id of the word
         """
-        return self.execute(queries.INSERT_WORD, (word, len(word))).lastrowid
+        self.insert_many_words((word,))
+        return self.word_ids[word]
 
     def insert_many_words(self, words):
         """
         Insert many words to the database (only those who doesn't exists already).
+        The new words get the next free word ids, and are added to the vocabulary.
         :param words: Iterable of words to be inserted
+        :raises CheckError: If one of the new words isn't a valid single word
         """
-        self.executemany(queries.INSERT_WORD, ((word, len(word)) for word in words))
+        next_word_id = self.next_word_id
+
+        # Give ids to the words that aren't in the vocabulary
+        new_word_ids = {}
+        for word in words:
+            if word not in self.word_ids and word not in new_word_ids:
+                self.assert_valid_word(word)
+                new_word_ids[word] = next_word_id
+                next_word_id += 1
+
+        self.executemany(queries.INSERT_WORD_WITH_ID,
+                         ((word_id, word, len(word)) for word, word_id in new_word_ids.items()))
+        self._insert_words_trigrams(new_word_ids.values())
+        self._add_to_vocabulary(new_word_ids)
 
     def insert_many_words_with_id(self, words_with_ids):
         """
         Insert many words to the database, with the given word ids.
         :param words_with_ids: Iterable of words and their ids to be inserted
         """
+        word_ids = {self.to_single_word(word): int(word_id) for word, word_id in words_with_ids}
         self.executemany(queries.INSERT_WORD_WITH_ID,
-                         ((word_id, self.to_single_word(word)) for word, word_id in words_with_ids))
+                         ((word_id, word, len(word)) for word, word_id in word_ids.items()))
+        self._insert_words_trigrams(word_ids.values())
+        self._add_to_vocabulary(word_ids)
 
-    # Will be used a lot for the same words, so caching the result can improve performance
-    @functools.lru_cache(WORD_IDS_CACHE_SIZE)
     def get_word_id(self, word):
         """
         Return the word_id of a word.
@@ -169,32 +529,32 @@ class BookDatabase(Database):
         :param word: The word to search for
         :return: The word id of the word
         """
-
         word = self.to_single_word(word)
-
-        # Most of the words we'll search for will already be inserted.
-        # So we should first search for the word, and only try to insert it if it doesn't exists,
-        # and not the other way around.
-        search_result = self.execute(queries.WORD_NAME_TO_ID, (word,)).fetchone()
-
-        return self.insert_word(word) if search_result is None else search_result[0]
+        word_id = self.word_ids.get(word)
+        return self.insert_word(word) if word_id is None else word_id
 
     def insert_many_word_appearances(self, word_appearances):
         """
          Insert many word appearances to the database, by using the word string.
+         The word names are converted to word ids using the vocabulary.
         :param word_appearances: Iterable of words appearances in the form of:
             (book_id, name, word_index, paragraph, line, line_index, line_offset, sentence, sentence_index)
             where name is assumed to be an existing word name.
         """
-        self.executemany(queries.INSERT_WORD_APPEARANCE, word_appearances)
+        word_ids = self.word_ids
+        self.insert_many_word_id_appearances((appr[0], word_ids[appr[1]]) + appr[2:] for appr in word_appearances)
 
     def insert_many_word_id_appearances(self, word_id_appearances):
         """
          Insert many word appearances to the database, by using word ids.
         :param word_id_appearances: Iterable of words appearances in the form of:
             (book_id, word_id, word_index, paragraph, line, line_index, line_offset, sentence, sentence_index).
+            In the compressed storage, the appearances of every book must be ordered by word_index.
         """
-        self.executemany(queries.INSERT_WORD_ID_APPEARANCE, word_id_appearances)
+        if self.compressed_storage:
+            self._insert_postings(word_id_appearances)
+        else:
+            self.executemany(queries.INSERT_WORD_ID_APPEARANCE, word_id_appearances)
 
     def insert_words_group(self, name):
         """
@@ -251,7 +611,10 @@ class BookDatabase(Database):
             (phrase_id, name, phrase_index)
             where name is assumed to be an existing word name.
         """
-        self.executemany(queries.INSERT_WORD_TO_PHRASE, words_in_phrase)
+        word_ids = self.word_ids
+        self.executemany(queries.INSERT_WORD_ID_TO_PHRASE,
+                         ((phrase_id, word_ids[name], phrase_index)
+                          for phrase_id, name, phrase_index in words_in_phrase))
 
     def insert_many_word_ids_to_phrase(self, phrase_id, word_ids):
         """
@@ -266,13 +629,100 @@ class BookDatabase(Database):
     # Advanced Insertion Functions
     #
 
-    def add_book(self, title, author, path, date):
+    @staticmethod
+    def _parse_book_batches(path):
+        """
+        Parse a book file into batches of appearances, in parallel if it is very big.
+        :param path: The path of the file to parse
+        :return: Generator of the book appearances batches, as yielded by parse_book_batches
+        """
+        if os.path.getsize(path) >= BookDatabase.PARALLEL_PARSE_MIN_SIZE:
+            return batch_appearances(parse_book_parallel(path))
+        return parse_book_batches(path)
+
+    def _book_appearances_rows(self, book_id, parsed_book):
+        """
+        Convert the already parsed word appearances of a book to appearance rows, batch by batch.
+        The new words of every batch are inserted before its rows are generated.
+        :param book_id: The book id of the book
+        :param parsed_book: Iterable of the book appearances batches, as yielded by parse_book_batches.
+            The words are trusted to be valid lower case words, so they aren't checked one by one.
+        :return: Generator of the rows of every batch, as accepted by insert_many_word_id_appearances
+        """
+        for batch in parsed_book:
+            # Insert the new words of the batch (keeping the order of their first appearance)
+            self.insert_many_words(dict.fromkeys(batch.words))
+
+            # Convert the words to a column of word ids, and generate the appearances row by row from the columns
+            word_ids = array.array(COLUMN_TYPECODE, map(self.word_ids.__getitem__, batch.words))
+            yield zip(itertools.repeat(book_id), word_ids, *batch.columns)
+
+    def _insert_book_appearances(self, book_id, parsed_book):
+        """
+        Insert the already parsed word appearances of a book, batch by batch.
+        :param book_id: The book id of the book
+        :param parsed_book: Iterable of the book appearances batches, as yielded by parse_book_batches.
+            The words are trusted to be valid lower case words, so they aren't checked one by one.
+        """
+        batches_rows = self._book_appearances_rows(book_id, parsed_book)
+        if self.compressed_storage:
+            # Encode the whole book at once, so every posting is written once
+            self.insert_many_word_id_appearances(itertools.chain.from_iterable(batches_rows))
+        else:
+            for rows in batches_rows:
+                self.insert_many_word_id_appearances(rows)
+
+    def _append_book_appearances(self, book_id, path, parse_state=None):
+        """
+        Parse the complete lines of a book file which weren't parsed yet, and insert their word appearances.
+        The state of the parser at the end is stored, so the next call will continue from the same place.
+        :param book_id: The book id of the book
+        :param path: The path to the file containing the book text
+        :param parse_state: The stored parse state of the book. Keep as None to parse the file from the start.
+        :return: The number of the inserted appearances
+        """
+        if parse_state is None:
+            offset, encoding, parser = 0, find_encoding(path), BookParser()
+        else:
+            offset, encoding, *counters = parse_state
+            parser = BookParser(*counters)
+
+        old_words_count = parser.words_count
+        lines = CompleteLinesReader(path, offset, encoding)
+        self._insert_book_appearances(book_id, parser.parse_lines_batches(lines))
+
+        self.execute(queries.REPLACE_BOOK_PARSE_STATE,
+                     (book_id, lines.offset, encoding, parser.words_count, parser.paragraph, parser.sentence,
+                      parser.words_in_sentence, parser.line, parser.previous_line))
+        return parser.words_count - old_words_count
+
+    def _insert_parsed_book(self, title, author, path, date, parsed_book):
+        """
+        Insert a book entry with all of its already parsed word appearances.
+        :param title: Title of the book
+        :param author: Author of the book
+        :param path: The path to the file containing the book text
+        :param date: A date related to the book to store (publish / file date)
+        :param parsed_book: Iterable of the book appearances batches, as yielded by parse_book_batches
+        :return: The book id of the newly inserted book
+        """
+
+        # Insert a new book entry, with the fingerprint of the file
+        book_id = self.insert_book(title, author, path, os.path.getsize(path), date,
+                                   os.path.getmtime(path), file_hash(path))
+
+        self._insert_book_appearances(book_id, parsed_book)
+        return book_id
+
+    def add_book(self, title, author, path, date, append_mode=False):
         """
         Add a new book in the database.
         :param title: Title of the book
         :param author: Author of the book
         :param path: The path to the file containing the book text
         :param date: A date related to the book to store (publish / file date)
+        :param append_mode: If True, the file is expected to grow, and new text can be added with append_book.
+            In this mode, the last line of the file isn't parsed until it is ended by a line break.
         :raises FileNotFoundError: If the path doesn't exists
         :return: The book id of the newly inserted book
         """
@@ -281,26 +731,156 @@ class BookDatabase(Database):
         if not os.path.exists(path):
             raise FileNotFoundError
 
-        # Insert a new book entry
-        size = os.path.getsize(path)
-        book_id = self.insert_book(title, author, path, size, date)
-
-        # Iterate the parsed book words, and keep track of the words & appearances which needs to be inserted
-        words = set()
-        appearances = []
-        for appr in parse_book(path):
-            word = self.to_single_word(appr[0])
-            words.add(word)
-            appearances.append((book_id, word) + appr[1:])
-
-        # Insert all the words and their appearances
-        self.insert_many_words(words)
-        self.insert_many_word_appearances(appearances)
+        if append_mode:
+            # The file is going to change, so there is no point in hashing it
+            book_id = self.insert_book(title, author, path, os.path.getsize(path), date, os.path.getmtime(path))
+            self._append_book_appearances(book_id, path)
+        else:
+            book_id = self._insert_parsed_book(title, author, path, date, self._parse_book_batches(path))
+        self.update_books_statistics([book_id])
+        self.update_books_vocabulary([book_id])
+        self.update_phrase_matches([book_id])
 
         # Call the book insert callbacks
         self.call_all_callbacks(self.book_insert_callbacks)
         return book_id
 
+    def add_many_books(self, books, processes=None):
+        """
+        Add many new books in the database.
+        The books are parsed concurrently by a pool of worker processes,
+        while all the insertions are done by this connection in a single fast load session,
+        in the order of the given books.
+        :param books: Iterable of books in the form of (title, author, path, date)
+        :param processes: The number of worker processes. Keep as None to use the number of CPUs.
+        :raises FileNotFoundError: If one of the paths doesn't exists
+        :raises NonUniqueError: If one of the books already exists. None of the books are inserted then.
+        :raises IntegrityError: If the database failed the integrity checks at the end of the session.
+            None of the books are inserted then.
+        :return: The list of the book ids of the newly inserted books
+        """
+        books = list(books)
+
+        # Make sure all the files exist before parsing any of them
+        for _title, _author, path, _date in books:
+            if not os.path.exists(path):
+                raise FileNotFoundError
+
+        processes = processes or os.cpu_count()
+        book_ids = []
+        with multiprocessing.Pool(processes) as pool, \
+                self.fast_load(tables=(BookDatabase.APPEARANCES_TABLE, BookDatabase.POSTINGS_TABLE)):
+            # Limit the number of parsed books waiting for insertion, to bound the memory usage
+            parsed_books = bounded_imap(pool, _parse_book_to_batches, (book[2] for book in books),
+                                        BookDatabase.PENDING_BOOKS_PER_PROCESS * processes)
+            for book, parsed_book in zip(books, parsed_books):
+                book_ids.append(self._insert_parsed_book(*book, parsed_book))
+
+        # Read the new books only after the indexes were rebuilt
+        self.update_books_statistics(book_ids)
+        self.update_books_vocabulary(book_ids)
+        self.update_phrase_matches(book_ids)
+
+        # Call the book insert callbacks once for all the inserted books.
+        # If the session failed, nothing was inserted, since it was rolled back.
+        if book_ids:
+            self.call_all_callbacks(self.book_insert_callbacks)
+
+        return book_ids
+
+    def _append_book_file(self, book_id, path):
+        """
+        Insert the appearances in the new lines of a book file, or in all its lines if it wasn't added in append mode
+        or was truncated, and update its fingerprint.
+        The content of the file isn't hashed, since only the parse offset is needed to continue the parsing.
+        :param book_id: The book id of the book
+        :param path: The path to the file containing the book text
+        :return: The number of the new appearances, and if the book was parsed again from the start
+        """
+        parse_state = self.execute(queries.BOOK_PARSE_STATE, (book_id,)).fetchone()
+        if parse_state is None or os.path.getsize(path) < parse_state[0]:
+            self._delete_book_appearances(book_id)
+            parse_state = None
+
+        new_appearances = self._append_book_appearances(book_id, path, parse_state)
+        self.update_book_fingerprint(book_id, os.path.getsize(path), os.path.getmtime(path), None)
+        return new_appearances, parse_state is None
+
+    def append_book(self, book_id):
+        """
+        Insert the appearances in the new lines that were appended to a book file since it was last parsed.
+        The parsing continues from the offset and the counters stored by the previous parse.
+        If the book wasn't added in append mode, or its file was truncated, it is parsed again from the start.
+        :param book_id: The book id of the book
+        :raises FileNotFoundError: If the book file doesn't exists
+        :return: The number of the new appearances
+        """
+        path = self.get_book_path(book_id)[0]
+        if not os.path.exists(path):
+            raise FileNotFoundError
+
+        new_appearances, parsed_again = self._append_book_file(book_id, path)
+
+        # Call the book insert callbacks, so the books data will be reloaded
+        if new_appearances or parsed_again:
+            self.update_books_statistics([book_id])
+            self.update_books_vocabulary([book_id])
+            self.update_phrase_matches([book_id])
+            self.call_all_callbacks(self.book_insert_callbacks)
+        return new_appearances
+
+    def sync_books(self, paths):
+        """
+        Re-parse the books whose files were changed since they were inserted.
+        A file is considered changed if its size or modification time is different,
+        and the hash of its content is different as well.
+        The files of books inserted before their hashes were stored are considered changed only if their size is
+        different. The books added in append mode are continued from their parse offset, as in append_book.
+        Only the word appearances of the changed books are replaced.
+        Paths that don't exist, or don't belong to an inserted book, are ignored.
+        :param paths: Iterable of the book file paths to check
+        :return: The list of the book ids of the re-parsed books
+        """
+        fingerprints = {path: fingerprint for path, *fingerprint in self.execute(queries.ALL_BOOK_FINGERPRINTS)}
+
+        updated_book_ids = []
+        for path in paths:
+            if path not in fingerprints or not os.path.exists(path):
+                continue
+
+            # Compare the cheap parts of the fingerprint first
+            book_id, size, mtime, content_hash = fingerprints[path]
+            new_size = os.path.getsize(path)
+            new_mtime = os.path.getmtime(path)
+            if (new_size, new_mtime) == (size, mtime):
+                continue
+
+            if self.execute(queries.BOOK_PARSE_STATE, (book_id,)).fetchone() is not None:
+                # Keep books which were added in append mode in that mode. Their content isn't hashed.
+                new_appearances, parsed_again = self._append_book_file(book_id, path)
+                if new_appearances or parsed_again:
+                    updated_book_ids.append(book_id)
+                continue
+
+            # The books inserted before the hashes were stored have only their size to compare to
+            new_content_hash = file_hash(path)
+            changed = new_size != size if content_hash is None else new_content_hash != content_hash
+            if changed:
+                # Replace all the appearances of the book
+                self._delete_book_appearances(book_id)
+                self._insert_book_appearances(book_id, self._parse_book_batches(path))
+                updated_book_ids.append(book_id)
+
+            self.update_book_fingerprint(book_id, new_size, new_mtime, new_content_hash)
+
+        # Call the book insert callbacks, so the books data will be reloaded
+        if updated_book_ids:
+            self.update_books_statistics(updated_book_ids)
+            self.update_books_vocabulary(updated_book_ids)
+            self.update_phrase_matches(updated_book_ids)
+            self.call_all_callbacks(self.book_insert_callbacks)
+        return updated_book_ids
+
     def add_phrase(self, phrase):
         """
         Add a new phrase in the database.
@@ -321,62 +901,237 @@ class BookDatabase(Database):
         words_in_phrase = ((phrase_id, word, index) for index, word in enumerate(words, start=1))
         self.insert_many_words_to_phrase(words_in_phrase)
 
+        # Store the appearances of the new phrase in all the books
+        self.executemany(queries.INSERT_PHRASE_MATCH, ((phrase_id,) + match for match in self.find_phrase(phrase_id)))
+
         # Call the phrase insert callbacks
         self.call_all_callbacks(self.phrase_insert_callbacks)
         return phrase_id
 
+    def update_phrase_matches(self, book_ids=None):
+        """
+        Calculate again the stored appearances of all the phrases in books.
+        :param book_ids: Iterable of the book ids of the books. Keep as None for all the books.
+        """
+        if book_ids is None:
+            self.execute(queries.DELETE_ALL_PHRASE_MATCHES)
+        else:
+            book_ids = list(book_ids)
+            self.executemany(queries.DELETE_BOOK_PHRASE_MATCHES, ((book_id,) for book_id in book_ids))
+
+        phrase_matches = self.find_many_phrases(book_ids=book_ids)
+        self.executemany(queries.INSERT_PHRASE_MATCH,
+                         ((phrase_id,) + match for phrase_id, matches in phrase_matches.items() for match in matches))
+
+    def update_books_statistics(self, book_ids=None):
+        """
+        Calculate again the stored statistics of books, from their word appearances.
+        :param book_ids: Iterable of the book ids of the books. Keep as None for all the books.
+        """
+        if book_ids is None and self.compressed_storage:
+            # Decode a single book at a time, so the whole corpus is never decoded at once
+            book_ids = [book_id for book_id, in self.execute(queries.ALL_BOOK_IDS).fetchall()]
+
+        for book_id in [None] if book_ids is None else book_ids:
+            book_id_filter = self._id_filter(book_id)
+            self.execute(queries.DELETE_BOOKS_STATISTICS.format(book_id_filter=book_id_filter))
+            self.execute(queries.REPLACE_BOOKS_STATISTICS.format(appearances_table=self._appearances_table(book_id),
+                                                                 book_id_filter=book_id_filter))
+
+    def update_books_vocabulary(self, book_ids=None):
+        """
+        Calculate again the stored distinct words of books, from their word appearances.
+        The postings have the same book and word ids as the appearances, so they are read without decoding them.
+        :param book_ids: Iterable of the book ids of the books. Keep as None for all the books.
+        """
+        appearances_table = BookDatabase.POSTINGS_TABLE if self.compressed_storage else \
+            BookDatabase.APPEARANCES_TABLE
+        for book_id in [None] if book_ids is None else book_ids:
+            book_id_filter = self._id_filter(book_id)
+            self.execute(queries.DELETE_BOOKS_VOCABULARY.format(book_id_filter=book_id_filter))
+            self.execute(queries.INSERT_BOOKS_VOCABULARY.format(appearances_table=appearances_table,
+                                                                book_id_filter=book_id_filter))
+
     #
     # Dynamic Database Queries Functions
     #
 
-    def build_and_exec(self, **kwargs):
+    def build_and_exec(self, page=None, **kwargs):
         """
         Dynamically build a query, and execute it.
+        :param page: The Page of the entries to fetch. Keep as None for all the entries.
         :param kwargs: Arguments to build_query
-        :return: All the matched entries
+        :return: All the matched entries.
+            If page is given, the entries in the page and the Page that continues it (None if it is the last).
         """
-        return self.execute(build_query(**kwargs)).fetchall()
+        query, params = build_query(page=page, **kwargs)
+        results = self.execute(query, params).fetchall()
+
+        # Only queries which were executed successfully are recorded
+        if self.index_advisor is not None:
+            self.index_advisor.record(query, params, page=page, **kwargs)
+        if page is None:
+            return results
+
+        # The keys of the page are selected after the columns, and one more entry than the page size is selected
+        keys_count = len(page.keys)
+        next_page = page._replace(after=results[page.size - 1][-keys_count:]) if len(results) > page.size else None
+        return [result[:-keys_count] for result in results[:page.size]], next_page
 
-    def search_books(self, tables=None, **kwargs):
+    def build_and_count(self, **kwargs):
         """
-        Search the books table with dynamic filters
-        :param tables: Additional tables needed for the search
+        Dynamically build a query, and count its entries without fetching them.
         :param kwargs: Arguments to build_query
-        :return: All the matched book entries
+        :return: The number of matched entries
+        """
+        query, params = build_count_query(**kwargs)
+        count = self.execute(query, params).fetchone()[0]
+
+        if self.index_advisor is not None:
+            self.index_advisor.record(query, params, **kwargs)
+        return count
+
+    def _books_search_args(self, tables, filters):
+        """
+        Get the arguments to build_query for searching the books table.
+        :param tables: Additional tables needed for the search
+        :param filters: The filters of the search
+        :return: Dict of the arguments
         """
         tables = set(tables) if tables else set()
         tables.add("book")
 
+        # The postings have the same book and word ids as the appearances, so they can filter the books instead
+        if self.compressed_storage:
+            if BookDatabase.APPEARANCES_TABLE in tables:
+                tables.remove(BookDatabase.APPEARANCES_TABLE)
+                tables.add(BookDatabase.POSTINGS_TABLE)
+
+            filters = {col_name: value.replace_table(BookDatabase.APPEARANCES_TABLE, BookDatabase.POSTINGS_TABLE)
+                       if isinstance(value, MemberOf) else value
+                       for col_name, value in filters.items()}
+
+        return dict(tables=tables, group_by="book_id", **use_trigram_index(tables, filters))
+
+    def search_books(self, tables=None, page=None, **kwargs):
+        """
+        Search the books table with dynamic filters
+        :param tables: Additional tables needed for the search
+        :param page: The Page of the books to fetch, by BOOKS_PAGE_KEYS. Keep as None for all the books.
+        :param kwargs: Arguments to build_query
+        :return: All the matched book entries, or the entries in the page and the next Page, as in build_and_exec
+        """
         return self.build_and_exec(
             cols=["book_id", "title", "author", "file_path", f"STRFTIME('{DATE_FORMAT}', creation_date)", "file_size"],
-            tables=tables,
-            group_by="book_id",
-            **kwargs
+            page=page,
+            **self._books_search_args(tables, kwargs)
         )
 
-    def search_word_appearances(self, cols=None, tables=None, unique_words=False, order_by=None, **kwargs):
+    def count_books(self, tables=None, **kwargs):
+        """
+        Count the books matched by search_books with the same filters.
+        :param tables: Additional tables needed for the search
+        :param kwargs: Arguments to build_query
+        :return: The number of matched books
+        """
+        return self.build_and_count(**self._books_search_args(tables, kwargs))
+
+    @staticmethod
+    def _to_postings_expressions(expressions):
+        """
+        Convert the expressions of a unique words search to expressions on the postings.
+        :param expressions: Iterable of the expressions
+        :return: List of the converted expressions, or None if some of them need the decoded positions
+        """
+        converted_expressions = []
+        for expression in expressions:
+            for appearances_expression, postings_expression in BookDatabase.POSTINGS_EXPRESSIONS.items():
+                expression = expression.replace(appearances_expression, postings_expression)
+            if BookDatabase.POSITION_COLUMNS_REGEX.search(expression):
+                return None
+            converted_expressions.append(expression)
+        return converted_expressions
+
+    def _word_appearances_search_args(self, tables, unique_words, filters, cols=None, order_by=None, page=None):
+        """
+        Get the arguments to build_query for searching the word appearances table.
+        :param tables: Additional tables needed for the search
+        :param unique_words: When True, the same word will not be repeated
+        :param filters: The filters of the search
+        :param cols: The columns to select
+        :param order_by: String to be used for ORDER BY
+        :param page: The Page of the search
+        :return: Dict of the arguments
+        """
+        tables = set(tables) if tables else set()
+        args = dict(cols=cols, order_by=order_by, page=page)
+
+        # The unique words which aren't filtered by their positions are searched in the postings,
+        # without decoding them in the compressed storage
+        position_filters = {col_name: value for col_name, value in filters.items()
+                            if self.POSITION_COLUMNS_REGEX.fullmatch(col_name) and to_filter(value) is not None}
+        postings_expressions = None
+        if self.compressed_storage and unique_words and not position_filters:
+            cols = list(cols or [])
+            postings_expressions = self._to_postings_expressions(
+                cols + ([order_by] if order_by else []) + list(page.keys if page else []))
+
+        if postings_expressions is not None:
+            tables.add(BookDatabase.POSTINGS_TABLE)
+            postings_expressions = iter(postings_expressions)
+            args["cols"] = list(itertools.islice(postings_expressions, len(cols))) or None
+            if order_by:
+                args["order_by"] = next(postings_expressions)
+            if page:
+                args["page"] = page._replace(keys=tuple(postings_expressions))
+        else:
+            # Only the postings of the filtered book and words are decoded in the compressed storage,
+            # and only their appearances in the filtered positions are kept
+            book_filter = to_filter(filters.get("book_id"))
+            word_filter = to_filter(filters.get("word_id"))
+            book_id = book_filter.value if isinstance(book_filter, Equals) else None
+            word_ids = (word_filter.value,) if isinstance(word_filter, Equals) else \
+                word_filter.values if isinstance(word_filter, In) else None
+            tables.add(self._appearances_table(book_id, word_ids, position_filters))
+
+        filters = use_trigram_index(tables, filters)
+        if unique_words:
+            filters["group_by"] = "word_id"
+
+        return dict(tables=tables, **args, **filters)
+
+    def search_word_appearances(self, cols=None, tables=None, unique_words=False, order_by=None, page=None,
+                                **kwargs):
         """
         Search the word appearances table with dynamic filters
         :param cols: Iterable of columns to select
         :param tables: Additional tables needed for the search
         :param unique_words: When True, the same word will not be repeated
         :param order_by: String to be used for ORDER BY
+        :param page: The Page of the appearances to fetch. Keep as None for all the appearances.
+            The appearances of a word are paged by APPEARANCES_PAGE_KEYS, and the unique words by their order and
+            their word_id.
         :param kwargs: Additional arguments to build_query
-        :return: All the matched appearances
+        :return: All the matched appearances, or the appearances in the page and the next Page, as in build_and_exec
         """
+        results = self.build_and_exec(**self._word_appearances_search_args(tables, unique_words, kwargs,
+                                                                           cols=cols, order_by=order_by, page=page))
+        if page is None:
+            return results
 
-        tables = set(tables) if tables else set()
-        tables.add("word_appearance")
-
-        if unique_words:
-            kwargs["group_by"] = "word_id"
+        # The keys of the page may have been converted to the postings, so the next page continues with the given keys
+        appearances, next_page = results
+        return appearances, next_page and next_page._replace(keys=page.keys)
 
-        return self.build_and_exec(
-            cols=cols,
-            tables=tables,
-            order_by=order_by,
-            **kwargs
-        )
+    def count_word_appearances(self, tables=None, unique_words=False, **kwargs):
+        """
+        Count the appearances matched by search_word_appearances with the same filters.
+        :param tables: Additional tables needed for the search
+        :param unique_words: When True, the matched words are counted instead of their appearances
+        :param kwargs: Additional arguments to build_query
+        :return: The number of matched appearances
+        """
+        return self.build_and_count(**self._word_appearances_search_args(tables, unique_words, kwargs))
 
     def word_location_to_offset(self, book_id, sentence, sentence_index, word_end_offset=False):
         """
@@ -388,6 +1143,7 @@ class BookDatabase(Database):
         :return: The offset as (line, offset) pair
         """
         query = queries.WORD_LOCATION_TO_END_OFFSET if word_end_offset else queries.WORD_LOCATION_TO_OFFSET
+        query = query.format(appearances_table=self._appearances_table(book_id))
         return self.execute(query, (book_id, sentence, sentence_index)).fetchone()
 
     #
@@ -404,34 +1160,40 @@ class BookDatabase(Database):
     def all_books(self, date_format=DATE_FORMAT):
         """
         Get a list of all the inserted books.
+        The books are read from the catalog, unless a different date format is needed.
         :param date_format: The date format to use for the book date
         :return: The list of books
         """
+        if date_format == DATE_FORMAT:
+            return self.catalog.all_books()
         return self.execute(queries.ALL_BOOKS, (date_format,)).fetchall()
 
     def get_book_title(self, book_id):
         """
-        Get the title of a book.
+        Get the title of a book, from the catalog.
         :param book_id: The book id of the book
-        :return: The book title
+        :return: The book title, as a single item tuple. None if there is no such book.
         """
-        return self.execute(queries.BOOK_ID_TO_TITLE, (book_id,)).fetchone()
+        book = self.catalog.get(book_id)
+        return (book.title,) if book else None
 
     def get_book_full_name(self, book_id):
         """
-        Get the full name (TITLE by AUTHOR) of a book.
+        Get the full name (TITLE by AUTHOR) of a book, from the catalog.
         :param book_id: The book id of the book
-        :return: The full name of the book
+        :return: The full name of the book, as a single item tuple. None if there is no such book.
         """
-        return self.execute(queries.BOOK_ID_TO_FULL_NAME, (book_id,)).fetchone()
+        book = self.catalog.get(book_id)
+        return (f"{book.title} by {book.author}",) if book else None
 
     def get_book_path(self, book_id):
         """
-        Get the file path of a book.
+        Get the file path of a book, from the catalog.
         :param book_id: The book id of the book
-        :return: The book file path
+        :return: The book file path, as a single item tuple. None if there is no such book.
         """
-        return self.execute(queries.BOOK_ID_TO_PATH, (book_id,)).fetchone()
+        book = self.catalog.get(book_id)
+        return (book.path,) if book else None
 
     def all_book_words(self, book_id):
         """
@@ -439,7 +1201,73 @@ class BookDatabase(Database):
         :param book_id: The book id of the book
         :return: The list of words
         """
-        return iter(self.execute(queries.ALL_BOOK_WORDS, (book_id,)))
+        query = queries.ALL_BOOK_WORDS.format(appearances_table=self._appearances_table(book_id))
+        return iter(self.execute(query, (book_id,)))
+
+    def get_books_statistics(self, book_id=None):
+        """
+        Get the statistics of a book, or of all the books, from the stored statistics of the books.
+        :param book_id: The book id of the book. Keep as None for all the books.
+        :return: Dict that maps the statistic names to their values. The averages are None if there are no words.
+            The names are words, unique_words, letters and letters_per_word,
+            and <part>s, words_per_<part> and letters_per_<part> for every part in STATISTICS_PARTS.
+        """
+        totals = self.execute(queries.BOOKS_STATISTICS_TOTALS.format(book_id_filter=self._id_filter(book_id)))
+        words, unique_words, letters, *parts_counts = totals.fetchone()
+
+        if book_id is None:
+            unique_words = self._corpus_unique_words()
+
+        return self._derive_statistics(words, unique_words, letters, parts_counts)
+
+    def get_statistics_matrix(self):
+        """
+        Get the statistics of every book and of all the books, by a single read of the stored statistics.
+        :return: Dict that maps every book id to the statistics of the book, as returned by get_books_statistics,
+            and None to the statistics of all the books
+        """
+        books_counts = {book_id: counts for book_id, *counts in self.execute(queries.ALL_BOOKS_STATISTICS)}
+        matrix = {book_id: self._derive_statistics(words, unique_words, letters, parts_counts)
+                  for book_id, (words, unique_words, letters, *parts_counts) in books_counts.items()}
+
+        # Sum the columns of all the books (the row of zeros keeps the columns when there are no books)
+        words, _unique_words, letters, *parts_counts = (sum(column) for column in
+                                                        zip(*books_counts.values(), [0] * 6))
+        matrix[None] = self._derive_statistics(words, self._corpus_unique_words(), letters, parts_counts)
+        return matrix
+
+    def _corpus_unique_words(self):
+        """
+        Count the words which appear in at least one book.
+        The same word can appear in many books, so the unique words of the books can't be summed.
+        :return: The number of the unique words in all the books
+        """
+        appearances_table = BookDatabase.POSTINGS_TABLE if self.compressed_storage else \
+            BookDatabase.APPEARANCES_TABLE
+        return self.execute(queries.CORPUS_UNIQUE_WORDS.format(appearances_table=appearances_table)).fetchone()[0]
+
+    @staticmethod
+    def _derive_statistics(words, unique_words, letters, parts_counts):
+        """
+        Create the statistics dict, as returned by get_books_statistics, from the counts of the books.
+        :param words: The number of words
+        :param unique_words: The number of unique words
+        :param letters: The number of letters
+        :param parts_counts: The number of every part in STATISTICS_PARTS
+        :return: The statistics dict
+        """
+        statistics = {
+            "words": words,
+            "unique_words": unique_words,
+            "letters": letters,
+            "letters_per_word": letters / words if words else None
+        }
+        for part, part_count in zip(BookDatabase.STATISTICS_PARTS, parts_counts):
+            statistics[f"{part}s"] = part_count
+            statistics[f"words_per_{part}"] = words / part_count if part_count else None
+            statistics[f"letters_per_{part}"] = letters / part_count if part_count else None
+
+        return statistics
 
     def all_groups(self):
         """
@@ -471,10 +1299,150 @@ class BookDatabase(Database):
         """
         return self.execute(queries.ALL_WORDS_IN_PHRASE, (phrase_id,)).fetchall()
 
+    def get_phrase_matches(self, phrase_id):
+        """
+        Get the stored appearances of a phrase in the books.
+        :param phrase_id: The phrase id of the phrase
+        :return: The list of appearances as (book_id, sentence, start_index, end_index) tuples, ordered by location.
+        """
+        return self.execute(queries.PHRASE_MATCHES, (phrase_id,)).fetchall()
+
+    def get_phrase_matches_with_offsets(self, phrase_id):
+        """
+        Get the stored appearances of a phrase in the books, with their book titles and offsets in the book files.
+        :param phrase_id: The phrase id of the phrase
+        :return: The list of appearances as (book_id, title, sentence, start_index, start_line, start_line_offset,
+            end_index, end_line, end_line_offset) tuples, ordered by location.
+            The end offset is of the end of the last word in the phrase.
+        """
+        # Only the postings of the phrase words are needed in the compressed storage
+        word_ids = [word_id for word_id, in self.words_in_phrase(phrase_id)]
+        query = queries.PHRASE_MATCHES_WITH_OFFSETS.format(appearances_table=self._appearances_table(word_ids=word_ids))
+        return self.execute(query, (phrase_id,)).fetchall()
+
     def find_phrase(self, phrase_id):
         """
         Search a phrase for all of his appearances in book.
+        The appearances of the rarest word in the phrase are the candidates for the phrase appearances,
+        and the other words are verified at their places in the sentence of every candidate,
+        so the search takes time proportional to the frequency of the rarest word.
         :param phrase_id: The phrase id of the phrase
-        :return: The list of appearances as (book_id, sentence, start_index, end_index) tuples.
-        """
-        return self._run_sql_script(BookDatabase.SCRIPTS.SEARCH_PHRASE, (phrase_id,)).fetchall()
+        :return: The list of appearances as (book_id, sentence, start_index, end_index) tuples, ordered by location.
+        """
+        word_ids = [word_id for word_id, in self.words_in_phrase(phrase_id)]
+        if not word_ids:
+            return []
+
+        counts = self._words_appearances_count(dict.fromkeys(word_ids))
+        rarest_word_id = min(counts, key=counts.get)
+        rarest_index = word_ids.index(rarest_word_id)
+
+        # Every appearance of the rarest word is a candidate, stored as (book_id, sentence, start_index)
+        candidates = {(book_id, sentence, sentence_index - rarest_index)
+                      for book_id, sentence, sentence_index in self._word_locations(rarest_word_id)}
+
+        # Verify the rarer words first, so the candidates are filtered as early as possible
+        other_indexes = sorted((index for index in range(len(word_ids)) if index != rarest_index),
+                               key=lambda index: counts[word_ids[index]])
+        for index in other_indexes:
+            if not candidates:
+                break
+            candidates = self._filter_phrase_candidates(candidates, word_ids[index], index)
+
+        return sorted((book_id, sentence, start_index, start_index + len(word_ids) - 1)
+                      for book_id, sentence, start_index in candidates)
+
+    def _words_appearances_count(self, word_ids):
+        """
+        Count the appearances of words, in order to find the rarest one.
+        In the rows storage, every count stops at the smallest count found so far,
+        so the counting takes time proportional to the frequency of the rarest word.
+        :param word_ids: Iterable of the word ids to count
+        :return: Dict that maps the word ids to their counts, ordered by counting order.
+            The first word with the minimal count has the exact minimal count.
+        """
+        counts = {}
+        if self.compressed_storage:
+            for word_id in word_ids:
+                counts[word_id] = self.execute(queries.WORD_POSTINGS_APPEARANCES_COUNT, (word_id,)).fetchone()[0]
+            return counts
+
+        limit = -1  # A negative limit is no limit
+        for word_id in word_ids:
+            counts[word_id] = self.execute(queries.LIMITED_WORD_APPEARANCES_COUNT, (word_id, limit)).fetchone()[0]
+            if limit < 0 or counts[word_id] < limit:
+                limit = counts[word_id]
+        return counts
+
+    def _word_locations(self, word_id, book_ids=None):
+        """
+        Get the locations of all the appearances of a word.
+        :param word_id: The word id of the word
+        :param book_ids: Container of the book ids to search in. Keep as None for all the books.
+        :return: Iterable of the locations as (book_id, sentence, sentence_index) tuples
+        """
+        if not self.compressed_storage:
+            return self.execute(queries.WORD_LOCATIONS, (word_id,)).fetchall()
+
+        return [(book_id, sentence, sentence_index)
+                for book_id, positions in self.execute(queries.WORD_POSTINGS, (word_id,)).fetchall()
+                if book_ids is None or book_id in book_ids
+                for *_position, sentence, sentence_index in decode_positions(positions)]
+
+    def _filter_phrase_candidates(self, candidates, word_id, phrase_index):
+        """
+        Keep only the phrase candidates that have a given word in a given place of the phrase.
+        :param candidates: Set of the candidates as (book_id, sentence, start_index) tuples
+        :param word_id: The word id of the word in the phrase
+        :param phrase_index: The index of the word in the phrase, starting from 0
+        :return: Set of the matching candidates
+        """
+        if self.compressed_storage:
+            # The postings aren't indexed by location, so compare with all the locations of the word in these books
+            locations = set(self._word_locations(word_id, {book_id for book_id, _sentence, _start in candidates}))
+            return {(book_id, sentence, start_index) for book_id, sentence, start_index in candidates
+                    if (book_id, sentence, start_index + phrase_index) in locations}
+
+        return {(book_id, sentence, start_index) for book_id, sentence, start_index in candidates
+                if self.execute(queries.WORD_AT_LOCATION,
+                                (book_id, sentence, start_index + phrase_index)).fetchone() == (word_id,)}
+
+    def find_many_phrases(self, phrase_ids=None, book_ids=None):
+        """
+        Search many phrases for all of their appearances in books, at once.
+        All the phrases are compiled into a single automaton, and the words of every book are read only once.
+        :param phrase_ids: Iterable of the phrase ids of the phrases. Keep as None for all the phrases.
+        :param book_ids: Iterable of the book ids of the books to search in. Keep as None for all the books.
+        :return: Dict that maps every phrase id to the list of its appearances,
+            as (book_id, sentence, start_index, end_index) tuples ordered by location, like find_phrase returns.
+        """
+        phrases = {}
+        for phrase_id, word_id in self.execute(queries.ALL_PHRASES_WORDS).fetchall():
+            phrases.setdefault(phrase_id, []).append(word_id)
+
+        if phrase_ids is not None:
+            phrases = {phrase_id: phrases.get(phrase_id, []) for phrase_id in phrase_ids}
+        if book_ids is None:
+            book_ids = [book_id for book_id, in self.execute(queries.ALL_BOOK_IDS).fetchall()]
+
+        matcher = PhraseMatcher(phrases)
+        appearances = {phrase_id: [] for phrase_id in phrases}
+        for book_id in sorted(book_ids):
+            # The phrases can't cross sentences, so every sentence is matched separately.
+            # The index of a word in its sentence is the number of the words before it in the sentence plus one.
+            sentences = itertools.groupby(self.all_book_words(book_id), key=lambda word: word[2])
+            for sentence, words in sentences:
+                for phrase_id, start_index, end_index in matcher.match(word[0] for word in words):
+                    appearances[phrase_id].append((book_id, sentence, start_index, end_index))
+
+        return appearances
+
+
+def _parse_book_to_batches(path):
+    """
+    Parse a book file into a list of batches of its appearances.
+    Used by the worker processes of BookDatabase.add_many_books, the batches are cheap to send between processes.
+    :param path: The path of the file to parse
+    :return: The list of the appearances batches, as yielded by parse_book_batches
+    """
+    return list(parse_book_batches(path))
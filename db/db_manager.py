@@ -1,7 +1,12 @@
+import contextlib
+import copy
+import itertools
 import os
+import pathlib
 import sqlite3
 
-from db.exceptions import raise_specific_exception
+import db.sql_queries as queries
+from db.exceptions import IntegrityError, raise_specific_exception
 from utils.utils import cached_read
 
 
@@ -21,6 +26,16 @@ def raise_specific_exception_wrapper(func):
     return _inner
 
 
+def _deny_main_changes(action, _arg1, _arg2, db_name, _trigger_or_view):
+    """
+    Authorizer that denies the changes of the main db, and allows the rest (like the changes of the temp tables).
+    Every change of the main db, including of its schema, changes the rows of one of its tables.
+    """
+    if action in (sqlite3.SQLITE_INSERT, sqlite3.SQLITE_UPDATE, sqlite3.SQLITE_DELETE) and db_name == "main":
+        return sqlite3.SQLITE_DENY
+    return sqlite3.SQLITE_OK
+
+
 class Database:
     """
     Database manager class.
@@ -31,8 +46,33 @@ class Database:
     # The directory with the script files
     SCRIPTS_DIR = r"scripts"
 
+    # The pragmas used during a fast load session, trading durability for speed
+    FAST_LOAD_PRAGMAS = {
+        "journal_mode": "MEMORY",
+        "synchronous": "OFF",
+        "temp_store": "MEMORY"
+    }
+
+    # The journal mode of the dbs stored in files.
+    # In WAL mode the readers of other connections don't block the writes, and the writes don't block them.
+    FILE_JOURNAL_MODE = "WAL"
+
+    # The URI of an in-memory db. It is named, so more connections can be opened to the same db.
+    MEMORY_DB_URI = "file:memory_db_{number}?mode=memory&cache=shared"
+
+    # The URI of a file db opened read only
+    READ_ONLY_FILE_URI = "{file_uri}?mode=ro"
+
+    # The number of prepared statements kept by every connection.
+    # The statements are cached by their text, so executing the same query with other values doesn't prepare it again.
+    CACHED_STATEMENTS = 256
+
+    # Numbers the in-memory dbs, so every connection gets a db of its own
+    _memory_dbs_counter = itertools.count()
+
     def __init__(self, db_path=None, always_create=False):
         self._curr_path = None
+        self._memory_db_uri = None
         self._conn = None  # type: sqlite3.Connection
         self._cursor = None  # type: sqlite3.Cursor
         self.new_connection(always_create, db_path)
@@ -48,7 +88,7 @@ class Database:
         if db_path == self._curr_path:
             return
 
-        disk_conn = sqlite3.connect(db_path)
+        disk_conn = sqlite3.connect(db_path, cached_statements=Database.CACHED_STATEMENTS)
         self.commit()
         self._conn.backup(disk_conn)
 
@@ -56,6 +96,8 @@ class Database:
             self.close(commit=False)
             self._conn = disk_conn
             self._cursor = self._conn.cursor()
+            self._curr_path = db_path
+            self.execute(f"PRAGMA journal_mode = {Database.FILE_JOURNAL_MODE}")
 
     def new_connection(self, always_create=True, new_path=None, commit=True):
         """
@@ -81,13 +123,69 @@ class Database:
             already_exists = False
 
         # Connect to the new path
-        self._conn = sqlite3.connect(new_path if new_path else ':memory:')
-        self._cursor = self._conn.cursor()
         self._curr_path = new_path
+        self._memory_db_uri = Database.MEMORY_DB_URI.format(number=next(Database._memory_dbs_counter))
+        self._conn = self._open_connection()
+        self._cursor = self._conn.cursor()
+        if new_path:
+            self.execute(f"PRAGMA journal_mode = {Database.FILE_JOURNAL_MODE}")
 
         # Return if a new db was created
         return already_exists and not always_create
 
+    def _open_connection(self, read_only=False, **kwargs):
+        """
+        Open a new connection to the current db.
+        :param read_only: Should the connection be unable to change the db. It can still use temp tables.
+        :param kwargs: Additional args to sqlite3.connect
+        :return: The new connection
+        """
+        kwargs.setdefault("cached_statements", Database.CACHED_STATEMENTS)
+        if self._curr_path and read_only:
+            file_uri = pathlib.Path(os.path.abspath(self._curr_path)).as_uri()
+            return sqlite3.connect(Database.READ_ONLY_FILE_URI.format(file_uri=file_uri), uri=True, **kwargs)
+        elif self._curr_path:
+            return sqlite3.connect(self._curr_path, **kwargs)
+
+        conn = sqlite3.connect(self._memory_db_uri, uri=True, **kwargs)
+        if read_only:
+            # An in-memory db can't be opened read only, so its changes are denied instead
+            conn.set_authorizer(_deny_main_changes)
+        return conn
+
+    def reader(self):
+        """
+        Create a read only copy of the database object, with a new connection to the current db.
+        The connection can be used from any thread, so the copy can read while this object keeps writing.
+        The copy doesn't block the writes: a file db is in WAL mode, and an in-memory db is read uncommitted.
+        The pending changes are committed first, so the copy sees them.
+        The connection can't change the db, but it can create temp tables.
+        The copy shares the rest of the state of this object, so subclasses should give it its own copy of any state
+        which its methods change or which refers to this object.
+        :return: The database copy, which should be closed when done
+        """
+        self.commit()
+
+        db_reader = copy.copy(self)
+        db_reader._conn = self._open_connection(read_only=True, check_same_thread=False)
+        db_reader._cursor = db_reader._conn.cursor()
+
+        # Don't lock the tables of an in-memory db while reading them, or the writes of this object would fail
+        # instead of waiting
+        db_reader.execute("PRAGMA read_uncommitted = ON")
+        return db_reader
+
+    def interrupt(self):
+        """
+        Abort the query that is running on the current connection.
+        Unlike the other methods, it can be called from any thread.
+        """
+        try:
+            self._conn.interrupt()
+        except sqlite3.ProgrammingError:
+            # The connection was already closed, so there is nothing to abort
+            pass
+
     @raise_specific_exception_wrapper
     def execute(self, *args, **kwargs):
         """ Execute a SQL statement. """
@@ -128,10 +226,88 @@ class Database:
         else:
             return self.execute(script, args)
 
+    @contextlib.contextmanager
+    def fast_load(self, tables=None):
+        """
+        Context manager for loading a lot of data into the database.
+        During the session the durability pragmas are relaxed, the secondary indexes are dropped,
+        and all the changes are done in a single transaction.
+        When the session is closed the indexes are rebuilt, and the integrity of the database and the foreign keys of
+        the loaded tables are checked, before the transaction is committed.
+        If the session raises or the checks fail, all its changes are rolled back instead.
+        :param tables: Iterable of the loaded tables, whose foreign keys are checked. Keep as None for all the tables.
+        :raises IntegrityError: If the database failed the integrity or the foreign keys checks
+        :return: The database object
+        """
+
+        # The pragmas can't be changed in the middle of a transaction
+        self.commit()
+        old_pragmas = {pragma: self.execute(f"PRAGMA {pragma}").fetchone()[0] for pragma in Database.FAST_LOAD_PRAGMAS}
+
+        # Leaving the WAL mode fails while other connections (like readers) are open, and it is fast enough anyway
+        if old_pragmas["journal_mode"] == Database.FILE_JOURNAL_MODE.lower():
+            del old_pragmas["journal_mode"]
+
+        for pragma in old_pragmas:
+            self.execute(f"PRAGMA {pragma} = {Database.FAST_LOAD_PRAGMAS[pragma]}")
+
+        # Drop the secondary indexes, so they are built once instead of being updated on every insertion
+        indexes = self.execute(queries.SECONDARY_INDEXES).fetchall()
+        for name, _sql in indexes:
+            self.execute(f"DROP INDEX {name}")
+
+        try:
+            yield self
+
+            # Make sure the loaded data is valid before it is committed
+            self._create_missing_indexes(indexes)
+            self._check_integrity(tables)
+        except BaseException:
+            # Don't keep a partial or an invalid load
+            self.rollback()
+            raise
+        finally:
+            # The indexes may be dropped again by the rollback, if they were rebuilt in its transaction
+            self._create_missing_indexes(indexes)
+            self.commit()
+
+            for pragma, value in old_pragmas.items():
+                self.execute(f"PRAGMA {pragma} = {value}")
+
+    def _create_missing_indexes(self, indexes):
+        """
+        Create the secondary indexes which don't exist.
+        :param indexes: Iterable of the indexes, as (name, sql) pairs
+        """
+        existing_indexes = {name for name, _sql in self.execute(queries.SECONDARY_INDEXES)}
+        for name, sql in indexes:
+            if name not in existing_indexes:
+                self.execute(sql)
+
+    def _check_integrity(self, tables=None):
+        """
+        Check the integrity of the database, and the foreign keys of tables.
+        :param tables: Iterable of the tables whose foreign keys are checked. Keep as None for all the tables.
+        :raises IntegrityError: If the database failed the integrity or the foreign keys checks
+        """
+        integrity_errors = self.execute(queries.QUICK_CHECK).fetchall()
+        if integrity_errors != [("ok",)]:
+            raise IntegrityError(integrity_errors)
+
+        foreign_key_checks = [queries.FOREIGN_KEY_CHECK] if tables is None else \
+            [queries.TABLE_FOREIGN_KEY_CHECK.format(table=table) for table in tables]
+        for foreign_key_check in foreign_key_checks:
+            if self.execute(foreign_key_check).fetchone():
+                raise IntegrityError("FOREIGN KEY constraint failed")
+
     def commit(self):
         """ Commit the current connection. """
         self._conn.commit()
 
+    def rollback(self):
+        """ Roll back the uncommitted changes of the current connection. """
+        self._conn.rollback()
+
     def close(self, commit=True):
         """
         Close the current connection.
@@ -0,0 +1,190 @@
+"""
+This file contains the index advisor, which finds the indexes missing for the dynamically built queries.
+"""
+
+import collections
+import re
+import sqlite3
+
+import db.sql_queries as queries
+from db.query_builder import Equals, In, MemberOf, Range, to_filter
+
+# The tables whose full scans are worth an index. The other tables are small enough to be scanned.
+ADVISED_TABLES = ("word_appearance", "word")
+
+# The name of the indexes created by the advisor
+ADVISED_INDEX_NAME = "advised_{table}_{columns}"
+
+# Matches a full scan of a table in the plan of a query, as described by EXPLAIN QUERY PLAN
+FULL_SCAN_REGEX = re.compile(r"^SCAN (?:TABLE )?(\w+)")
+
+# The maximal number of query shapes recorded, so a stream of different shapes can't grow the memory usage
+MAX_RECORDED_QUERIES = 1024
+
+# A query shape recorded by the advisor, with the values it was last executed with
+RecordedQuery = collections.namedtuple("RecordedQuery", ["params", "tables", "filters", "executions"])
+
+
+class IndexAdvice(collections.namedtuple("IndexAdvice", ["table", "columns", "queries", "executions"])):
+    """
+    An index that would replace the full scans of a table in some query shapes.
+    The queries are the texts of the query shapes, and executions is the number of times they were executed.
+    """
+
+    @property
+    def name(self):
+        return ADVISED_INDEX_NAME.format(table=self.table, columns="_".join(self.columns))
+
+    @property
+    def sql(self):
+        return queries.CREATE_ADVISED_INDEX.format(name=self.name, table=self.table, columns=", ".join(self.columns))
+
+
+class IndexAdvisor:
+    """
+    Records the shapes of the queries built by build_query, and advises indexes for their full scans.
+    The shape of a query is its text, which doesn't depend on the values of its filters.
+    """
+
+    def __init__(self, db):
+        """
+        :param db: The database which executes the queries
+        """
+        self._db = db
+        self._queries = {}  # Maps the recorded query texts to their RecordedQuery
+        self._tables_columns = {}  # Cache of the columns of every table
+
+    def clear(self):
+        """ Forget the recorded queries and the cached columns, which belong to the previous db. """
+        self._queries.clear()
+        self._tables_columns.clear()
+
+    def record(self, query, params, tables=None, cols=None, group_by=None, order_by=None, page=None, **filters):
+        """
+        Record an executed query.
+        :param query: The query, as built by build_query
+        :param params: The values of the query filters
+        :param tables, cols, group_by, order_by, page, filters: The arguments the query was built from
+        """
+        recorded = self._queries.get(query)
+        if recorded is not None:
+            self._queries[query] = recorded._replace(params=params, executions=recorded.executions + 1)
+        elif len(self._queries) < MAX_RECORDED_QUERIES:
+            self._queries[query] = RecordedQuery(params, tuple(tables), filters, 1)
+
+    def _full_scans(self, query, params):
+        """
+        Find the advised tables that are fully scanned by a query.
+        :param query: The query
+        :param params: The values of the query filters
+        :return: Set of the scanned tables. Empty if the query can't be planned anymore
+            (like a query of a temporary table that was dropped).
+        """
+        try:
+            plan = self._db.execute(queries.EXPLAIN_QUERY_PLAN.format(query=query), params).fetchall()
+        except sqlite3.Error:
+            return set()
+
+        scans = (FULL_SCAN_REGEX.match(detail) for *_ids, detail in plan)
+        return {scan.group(1) for scan in scans if scan and scan.group(1) in ADVISED_TABLES}
+
+    def _table_columns(self, table):
+        """
+        :param table: The table name
+        :return: Set of the columns of the table
+        """
+        if table not in self._tables_columns:
+            self._tables_columns[table] = {name for name, in self._db.execute(queries.TABLE_COLUMNS, (table,))}
+        return self._tables_columns[table]
+
+    @staticmethod
+    def _filters_scopes(tables, filters):
+        """
+        Find the tables that every filter of a query applies to, including the filters nested in MemberOf filters.
+        :param tables: The tables the query selects from
+        :param filters: The filters of the query
+        :return: Generator of (joined tables, filters) pairs
+        """
+        yield tables, filters
+
+        for value in filters.values():
+            if isinstance(value, MemberOf):
+                yield from IndexAdvisor._filters_scopes((value.table,), value.filters)
+
+    def _scan_index(self, table, joined_tables, filters):
+        """
+        Choose an index that replaces the full scan of a table.
+        An index on the filters of the table itself is preferred. Without such filters, an index on the filters of a
+        joined table lets SQLite read the joined table first, and look up only the matched rows of the scanned table.
+        :param table: The scanned table
+        :param joined_tables: The tables joined in the scope of the scan, including the scanned table
+        :param filters: The filters of the scope
+        :return: The table to index and the columns of the index, or None if no index can help
+        """
+        for index_table in [table] + sorted(set(joined_tables) - {table}):
+            if index_table in ADVISED_TABLES:
+                columns = self._index_columns(index_table, filters)
+                if columns:
+                    return index_table, columns
+
+        return None
+
+    def _index_columns(self, table, filters):
+        """
+        Choose the columns of an index that answers the filters on a table.
+        The equality filters come first, followed by a single range filter, which is the order an index can use them.
+        LIKE filters can't be answered by an index in general, so they are ignored.
+        :param table: The table to index
+        :param filters: The filters of the query
+        :return: Tuple of the columns, empty if no index can help
+        """
+        table_columns = self._table_columns(table)
+        equality_columns = []
+        range_columns = []
+        for col_name, value in filters.items():
+            value_filter = to_filter(value)
+            if col_name not in table_columns:
+                continue
+            elif isinstance(value_filter, (Equals, In, MemberOf)):
+                equality_columns.append(col_name)
+            elif isinstance(value_filter, Range):
+                range_columns.append(col_name)
+
+        return tuple(equality_columns + range_columns[:1])
+
+    def recommend(self):
+        """
+        Advise the indexes that would replace the full scans of the advised tables in the recorded queries.
+        :return: List of IndexAdvice, ordered by the number of executions they would help, descending
+        """
+        advices = collections.defaultdict(list)
+        for query, recorded in self._queries.items():
+            scanned_tables = self._full_scans(query, recorded.params)
+            for joined_tables, filters in self._filters_scopes(recorded.tables, recorded.filters):
+                for table in scanned_tables.intersection(joined_tables):
+                    index = self._scan_index(table, joined_tables, filters)
+                    if index and query not in advices[index]:
+                        advices[index].append(query)
+
+        return sorted((IndexAdvice(table, columns, advised_queries,
+                                   sum(self._queries[query].executions for query in advised_queries))
+                       for (table, columns), advised_queries in advices.items()),
+                      key=lambda advice: advice.executions, reverse=True)
+
+    def create_indexes(self, advices=None):
+        """
+        Create advised indexes, and check which of the query shapes they were advised for scan less tables now.
+        :param advices: The IndexAdvice list to create. Keep as None for all the recommended indexes.
+        :return: List of (IndexAdvice, the helped queries) pairs
+        """
+        if advices is None:
+            advices = self.recommend()
+
+        scans = {query: self._full_scans(query, self._queries[query].params)
+                 for advice in advices for query in advice.queries}
+        for advice in advices:
+            self._db.execute(advice.sql)
+
+        return [(advice, [query for query in advice.queries
+                          if self._full_scans(query, self._queries[query].params) < scans[query]])
+                for advice in advices]
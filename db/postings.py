@@ -0,0 +1,87 @@
+"""
+This file handles the compressed storage of word appearances.
+All the appearances of a word in a book are stored as a single posting blob, where every position is a sequence
+of varints, and the fields which only grow along the book are stored as the difference from the previous position.
+"""
+
+# The position fields, in the order of the appearances columns:
+#   word_index, paragraph, line, line_index, line_offset, sentence, sentence_index
+# True for the fields stored as the difference from the previous position
+DELTA_FIELDS = (True, True, True, False, False, True, False)
+FIELDS_COUNT = len(DELTA_FIELDS)
+
+
+def _write_varint(buffer, number):
+    """
+    Write a non negative integer to a buffer as a varint (7 bits in every byte, the high bit marks continuation).
+    :param buffer: The bytearray to write to
+    :param number: The number to write
+    """
+    while number >= 0x80:
+        buffer.append((number & 0x7F) | 0x80)
+        number >>= 7
+    buffer.append(number)
+
+
+def decode_positions(blob):
+    """
+    Generator of the positions stored in a posting blob.
+    :param blob: The posting blob
+    :return: Generator of the positions, as tuples of the position fields
+    """
+    values = [0] * FIELDS_COUNT
+    field = 0
+    number = 0
+    shift = 0
+
+    for byte in blob:
+        number |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            # The varint continues in the next byte
+            shift += 7
+            continue
+
+        values[field] = values[field] + number if DELTA_FIELDS[field] else number
+        number = 0
+        shift = 0
+        field += 1
+
+        if field == FIELDS_COUNT:
+            yield tuple(values)
+            field = 0
+
+
+class PostingEncoder:
+    """
+    Encodes the positions of a word in a book, one by one, into a posting blob.
+    The positions must be added by the order of their word index.
+    """
+
+    def __init__(self, blob=b""):
+        """
+        :param blob: An existing posting blob to continue
+        """
+        self.data = bytearray(blob)
+        self.count = 0
+        self.previous = (0,) * FIELDS_COUNT
+
+        # Find the last position in the existing blob
+        for position in decode_positions(blob):
+            self.count += 1
+            self.previous = position
+
+    def add(self, position):
+        """
+        Add the next position of the word.
+        :param position: Tuple of the position fields
+        """
+        for value, previous_value, is_delta in zip(position, self.previous, DELTA_FIELDS):
+            _write_varint(self.data, value - previous_value if is_delta else value)
+
+        self.previous = position
+        self.count += 1
+
+    @property
+    def blob(self):
+        """ The posting blob of all the positions added """
+        return bytes(self.data)
@@ -1,44 +1,234 @@
-def build_query(cols=None, tables=None, group_by=None, order_by=None, **kwargs):
+import collections
+
+# The escape character of the LIKE patterns built by build_query
+LIKE_ESCAPE = "\\"
+
+
+def escape_like(text, wildcards="%_"):
+    """
+    Escape the wildcards of LIKE in a text, so it is matched literally by the patterns of build_query.
+    :param text: The text to escape
+    :param wildcards: The wildcards to escape, the others keep their meaning
+    :return: The escaped text
+    """
+    for special_char in LIKE_ESCAPE + wildcards:
+        text = text.replace(special_char, LIKE_ESCAPE + special_char)
+    return text
+
+
+#
+# Filters
+# Every filter compiles to a constraint on a single column, which SQLite can answer with an index on the column.
+#
+
+class Equals(collections.namedtuple("Equals", ["value"])):
+    """ Match the rows where the column equals a value """
+
+    def to_sql(self, col_name):
+        return f'{col_name} == ?', (self.value,)
+
+
+class Like(collections.namedtuple("Like", ["pattern"])):
+    """ Match the rows where the column matches a LIKE pattern, which is escaped with LIKE_ESCAPE """
+
+    def to_sql(self, col_name):
+        return f"{col_name} LIKE ? ESCAPE '{LIKE_ESCAPE}'", (self.pattern,)
+
+
+class Range(collections.namedtuple("Range", ["minimum", "maximum"])):
+    """ Match the rows where the column is between two values, including them. A None bound isn't applied. """
+
+    def to_sql(self, col_name):
+        if self.minimum is not None and self.maximum is not None:
+            return f'{col_name} BETWEEN ? AND ?', (self.minimum, self.maximum)
+        elif self.minimum is not None:
+            return f'{col_name} >= ?', (self.minimum,)
+        elif self.maximum is not None:
+            return f'{col_name} <= ?', (self.maximum,)
+        else:
+            return None, ()
+
+
+class In(collections.namedtuple("In", ["values"])):
+    """ Match the rows where the column is one of the values """
+
+    def __new__(cls, values):
+        return super().__new__(cls, tuple(values))
+
+    def to_sql(self, col_name):
+        return f'{col_name} IN ({", ".join("?" * len(self.values))})', self.values
+
+
+class MemberOf(collections.namedtuple("MemberOf", ["table", "column", "filters"])):
+    """
+    Match the rows where the column appears in a column of another table, in the rows matched by filters of its own.
+    The membership is checked by an uncorrelated sub-query, so SQLite runs it once instead of once for every row,
+    and looks up the results in the indexes of the column.
+    """
+
+    def __new__(cls, table, column=None, **filters):
+        """
+        :param table: The table to look in
+        :param column: The column to look in. Keep as None for the column with the same name.
+        :param filters: Filters on the rows of the table, as in build_query
+        """
+        return super().__new__(cls, table, column, filters)
+
+    def replace_table(self, old_table, new_table):
+        """
+        Replace a table in the filter and in its nested filters.
+        :param old_table: The table to replace
+        :param new_table: The table to look in instead
+        :return: The new filter
+        """
+        filters = {col_name: value.replace_table(old_table, new_table) if isinstance(value, MemberOf) else value
+                   for col_name, value in self.filters.items()}
+        return MemberOf(new_table if self.table == old_table else self.table, self.column, **filters)
+
+    def to_sql(self, col_name):
+        column = self.column or col_name
+        where, params = build_where(self.filters)
+        return f'{col_name} IN (SELECT {column} FROM {self.table}{where})', params
+
+
+class Page(collections.namedtuple("Page", ["keys", "size", "after", "descending"])):
+    """
+    A page of the results of a query, which continues from the last result of the previous page (keyset pagination).
+    Unlike OFFSET, the results before the page are skipped by the ordering keys, without reading them.
+    """
+
+    def __new__(cls, keys, size, after=None, descending=False):
+        """
+        :param keys: The expressions the results are ordered by. The last one must be unique, like an id.
+        :param size: The maximal number of results in the page
+        :param after: The values of the keys in the last result of the previous page. Keep as None for the first page.
+        :param descending: Are the results ordered in descending order
+        """
+        return super().__new__(cls, tuple(keys), size, after, descending)
+
+    def to_sql(self):
+        """
+        :return: The constraint of the keys (None for the first page) with its values, and the ORDER BY line
+        """
+        keys_str = ", ".join(self.keys)
+        direction = "DESC" if self.descending else "ASC"
+        order_by = ", ".join(f'{key} {direction}' for key in self.keys)
+        if self.after is None:
+            return None, (), order_by
+
+        placeholders = ", ".join("?" * len(self.keys))
+        return f'({keys_str}) {"<" if self.descending else ">"} ({placeholders})', tuple(self.after), order_by
+
+
+def to_filter(value):
+    """
+    Convert a filter value to a filter.
+    :param value: A filter, a string for a LIKE pattern, a list, tuple or set of values to match any of them,
+        or any other value to compare with "=="
+    :return: The filter, or None if the value is an empty filter
+    """
+    # Empty filters don't need to be applied
+    if value is None or value == '':
+        return None
+    elif hasattr(value, "to_sql"):
+        return value
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        return In(value)
+    elif isinstance(value, str):
+        return Like(value)
+    else:
+        return Equals(value)
+
+
+def build_where(filters):
+    """
+    Create the WHERE line of a query.
+    :param filters: Dict that maps columns to the filters to apply on them
+    :return: The WHERE line (empty if there are no constraints) and the tuple of the filter values
+    """
+    constraints = []
+    params = []
+    for col_name, value in filters.items():
+        value_filter = to_filter(value)
+        if value_filter is not None:
+            constraint, filter_params = value_filter.to_sql(col_name)
+            if constraint:
+                constraints.append(constraint)
+                params.extend(filter_params)
+
+    where = ' WHERE ' + ' AND '.join(constraints) if constraints else ''
+    return where, tuple(params)
+
+
+def build_query(cols=None, tables=None, group_by=None, order_by=None, page=None, **kwargs):
     """
     Dynamically create a simple SQL query from python.
     :param cols: Iterable of columns to select
     :param tables: Iterable of tables to select from
     :param group_by: String to be used for GROUP BY
     :param order_by: String to be used for ORDER BY
-    :param kwargs: Filters to apply in the query
-    :return: The built query
+    :param page: The Page of the results to select. The keys of the page are selected after cols,
+        and one more result than the page size is selected, to know if there is a next page.
+        The results are ordered by the keys of the page instead of order_by.
+    :param kwargs: Filters to apply in the query, as converted by to_filter
+    :return: The built query, with a placeholder for every filter value, and the tuple of the filter values.
+        The query text depends only on the filtered columns and the shapes of their filters, so it is the same
+        for any values.
     """
     assert len(tables)
 
     # Create SELECT line
     cols_str = ", ".join(cols) if cols else "*"
+    if page:
+        # The keys are selected as well, so the next page can continue from the last result
+        cols_str += ", " + ", ".join(page.keys)
     query = f'SELECT {cols_str} FROM '
 
     # Create FROM line
     # Automatically add bracelets around strings with space inside them. Useful for nested queries.
     query += ' NATURAL JOIN '.join(f'({table})' if ' ' in table else table for table in tables)
 
-    # Apply all filters in the kwargs dict
-    constraints = []
-    for col_name, value in kwargs.items():
-        # Empty filters don't need to be applied
-        if value not in (None, ''):
-            # Use "LIKE" for strings, and "==" otherwise
-            if isinstance(value, str):
-                constraints.append(f'{col_name} LIKE "{value}"')
-            else:
-                constraints.append(f'{col_name} == {value}')
-
     # Create WHERE line if there are constraints
-    if constraints:
-        query += ' WHERE ' + ' AND '.join(constraints)
+    where, params = build_where(kwargs)
+    page_constraint, page_params, order_by = page.to_sql() if page else (None, (), order_by)
+    having = ''
+    if page_constraint:
+        # Skip the results before the page. The keys of grouped results may be aggregates,
+        # so they are checked after the grouping.
+        if group_by:
+            having = ' HAVING ' + page_constraint
+        else:
+            where += (' AND ' if where else ' WHERE ') + page_constraint
+        params += page_params
+    query += where
 
     # Create GROUP BY line if needed
     if group_by:
-        query += ' GROUP BY ' + group_by
+        query += ' GROUP BY ' + group_by + having
 
     # Create ORDER BY line if needed
     if order_by:
         query += ' ORDER BY ' + order_by
 
-    return query
+    # Create LIMIT line for the page
+    if page:
+        query += ' LIMIT ?'
+        params += (page.size + 1,)
+
+    return query, params
+
+
+def build_count_query(cols=None, tables=None, group_by=None, order_by=None, page=None, **kwargs):
+    """
+    Dynamically create a query that counts the results of the query build_query creates from the same arguments.
+    It doesn't select, group or order the results, so it is faster than counting them.
+    :param cols: Ignored, the results are counted regardless of their columns
+    :param tables: Iterable of tables to select from
+    :param group_by: The column the results are grouped by, if they are
+    :param order_by: Ignored, the results are counted regardless of their order
+    :param page: Ignored, all the results are counted
+    :param kwargs: Filters to apply in the query, as converted by to_filter
+    :return: The built query, and the tuple of the filter values
+    """
+    count = f'COUNT(DISTINCT {group_by})' if group_by else 'COUNT(*)'
+    return build_query(cols=[count], tables=tables, **kwargs)
@@ -9,32 +9,82 @@ This files contains the different SQL queries used.
 
 # language=SQL
 INSERT_BOOK = """
-INSERT INTO book(title, author, file_path, file_size, creation_date)
+INSERT INTO book(title, author, file_path, file_size, creation_date, file_mtime, file_hash)
+values (?, ?, ?, ?, ?, ?, ?);
+"""
+
+# language=SQL
+INSERT_WORD_WITH_ID = """
+INSERT INTO word(word_id, name, length)
+values (?, ?, ?);
+"""
+
+# The trigrams of the texts in an indexed column, lowered like LIKE compares them (only the ASCII letters).
+# They are inserted in the order of the primary key, so the pages of the table are filled in order.
+# language=SQL
+INSERT_TEXT_TRIGRAMS = """
+WITH RECURSIVE trigram_start(position) AS (
+    SELECT 1
+    UNION ALL
+    SELECT position + 1 FROM trigram_start
+    WHERE position < (SELECT MAX(length({column})) - 2 FROM {table} WHERE {id_column} {id_filter})
+)
+INSERT OR IGNORE INTO text_trigram(source, trigram, object_id)
+SELECT ?, lower(substr({column}, position, 3)), {id_column}
+FROM {table} CROSS JOIN trigram_start
+WHERE {id_column} {id_filter} AND position <= length({column}) - 2
+ORDER BY 2, 3;
+"""
+
+# language=SQL
+INSERT_WORD_ID_APPEARANCE = """
+INSERT INTO word_appearance(book_id, word_id, word_index, paragraph, line, line_index, line_offset, sentence, sentence_index)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);
+"""
+
+# language=SQL
+REPLACE_WORD_POSTING = """
+INSERT OR REPLACE INTO word_posting(book_id, word_id, appearances_count, positions)
+values (?, ?, ?, ?);
+"""
+
+# language=SQL
+INSERT_PHRASE_MATCH = """
+INSERT INTO phrase_match(phrase_id, book_id, sentence, start_index, end_index)
 values (?, ?, ?, ?, ?);
 """
 
 # language=SQL
-INSERT_WORD = """
-INSERT OR IGNORE INTO word(name, length)
-values (?, ?);
+REPLACE_BOOKS_STATISTICS = """
+INSERT OR REPLACE INTO book_statistics(book_id, words_count, unique_words_count, letters_count, paragraphs_count,
+                                       lines_count, sentences_count)
+SELECT book_id, COUNT(word_index), COUNT(DISTINCT word_id), SUM(length), COUNT(DISTINCT paragraph),
+    COUNT(DISTINCT line), COUNT(DISTINCT sentence)
+FROM {appearances_table} NATURAL JOIN word
+WHERE book_id {book_id_filter}
+GROUP BY book_id;
 """
 
 # language=SQL
-INSERT_WORD_WITH_ID = """
-INSERT INTO word(word_id, name)
-values (?, ?);
+INSERT_BOOKS_VOCABULARY = """
+INSERT OR IGNORE INTO book_word(word_id, book_id)
+SELECT DISTINCT word_id, book_id
+FROM {appearances_table}
+WHERE book_id {book_id_filter}
+ORDER BY word_id, book_id;
 """
 
 # language=SQL
-INSERT_WORD_APPEARANCE = """
-INSERT INTO word_appearance(book_id, word_id, word_index, paragraph, line, line_index, line_offset, sentence, sentence_index)
-VALUES (?, (SELECT word_id FROM word WHERE name == ?), ?, ?, ?, ?, ?, ?, ?);
+REPLACE_SETTING = """
+INSERT OR REPLACE INTO setting(name, value)
+values (?, ?);
 """
 
 # language=SQL
-INSERT_WORD_ID_APPEARANCE = """
-INSERT INTO word_appearance(book_id, word_id, word_index, paragraph, line, line_index, line_offset, sentence, sentence_index)
-VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);
+REPLACE_BOOK_PARSE_STATE = """
+INSERT OR REPLACE INTO book_parse_state(book_id, file_offset, encoding, words_count, paragraph, sentence,
+                                        words_in_sentence, line, previous_line)
+values (?, ?, ?, ?, ?, ?, ?, ?, ?);
 """
 
 # language=SQL
@@ -55,17 +105,62 @@ INSERT INTO phrase(phrase_text, words_count) VALUES (?, ?);
 """
 
 # language=SQL
-INSERT_WORD_TO_PHRASE = """
+INSERT_WORD_ID_TO_PHRASE = """
 INSERT INTO word_in_phrase(phrase_id, word_id, phrase_index)
-values (?, (SELECT word_id FROM word WHERE name == ?), ?);
+values (?, ?, ?);
 """
 
+#
+# UPDATE DATABASE
+#
+
 # language=SQL
-INSERT_WORD_ID_TO_PHRASE = """
-INSERT INTO word_in_phrase(phrase_id, word_id, phrase_index)
-values (?, ?, ?);
+UPDATE_BOOK_FINGERPRINT = """
+UPDATE book SET file_size = ?, file_mtime = ?, file_hash = ?
+WHERE book_id == ?;
+"""
+
+# language=SQL
+DELETE_BOOK_APPEARANCES = """
+DELETE FROM word_appearance
+WHERE book_id == ?;
+"""
+
+# language=SQL
+DELETE_BOOK_POSTINGS = """
+DELETE FROM word_posting
+WHERE book_id == ?;
+"""
+
+# language=SQL
+DELETE_BOOK_PHRASE_MATCHES = """
+DELETE FROM phrase_match
+WHERE book_id == ?;
 """
 
+# language=SQL
+DELETE_ALL_PHRASE_MATCHES = "DELETE FROM phrase_match"
+
+# language=SQL
+DELETE_BOOKS_STATISTICS = "DELETE FROM book_statistics " \
+                          "WHERE book_id {book_id_filter}"
+
+# language=SQL
+DELETE_ALL_APPEARANCES = "DELETE FROM word_appearance"
+
+# language=SQL
+DELETE_ALL_POSTINGS = "DELETE FROM word_posting"
+
+# language=SQL
+DELETE_BOOKS_VOCABULARY = "DELETE FROM book_word " \
+                          "WHERE book_id {book_id_filter}"
+
+# language=SQL
+DELETE_ALL_TEXT_TRIGRAMS = "DELETE FROM text_trigram"
+
+# language=SQL
+ADD_BOOK_COLUMN = "ALTER TABLE book ADD COLUMN {column}"
+
 #
 # SIMPLE QUERIES
 #
@@ -80,39 +175,87 @@ ALL_BOOKS = "SELECT book_id, title, author, file_path, file_size, STRFTIME(?, cr
             "FROM book"
 
 # language=SQL
-BOOK_ID_TO_TITLE = "SELECT title " \
-                   "FROM book " \
+ALL_BOOK_FINGERPRINTS = "SELECT file_path, book_id, file_size, file_mtime, file_hash " \
+                        "FROM book"
+
+# language=SQL
+BOOK_PARSE_STATE = "SELECT file_offset, encoding, words_count, paragraph, sentence, words_in_sentence, line, " \
+                   "previous_line " \
+                   "FROM book_parse_state " \
                    "WHERE book_id == ?"
 
 # language=SQL
-BOOK_ID_TO_FULL_NAME = "SELECT title || ' by ' || author " \
-                       "FROM book " \
-                       "WHERE book_id == ?"
+BOOK_COLUMNS = "SELECT name " \
+               "FROM pragma_table_info('book')"
 
 # language=SQL
-BOOK_ID_TO_PATH = "SELECT file_path " \
-                  "FROM book " \
-                  "WHERE book_id == ?"
+SETTING = "SELECT value " \
+          "FROM setting " \
+          "WHERE name == ?"
 
 # language=SQL
-ALL_BOOK_WORDS = "SELECT word_id, paragraph, sentence, line, line_offset " \
+ALL_BOOK_IDS = "SELECT book_id " \
+               "FROM book"
+
+# language=SQL
+BOOK_APPEARANCES = "SELECT book_id, word_id, word_index, paragraph, line, line_index, line_offset, sentence, " \
+                   "sentence_index " \
+                   "FROM word_appearance " \
+                   "WHERE book_id == ? " \
+                   "ORDER BY word_index"
+
+# language=SQL
+WORD_POSTING = "SELECT positions " \
+               "FROM word_posting " \
+               "WHERE book_id == ? AND word_id == ?"
+
+# language=SQL
+WORD_POSTINGS = "SELECT book_id, positions " \
+                "FROM word_posting " \
+                "WHERE word_id == ?"
+
+# language=SQL
+WORD_POSTINGS_APPEARANCES_COUNT = "SELECT TOTAL(appearances_count) " \
+                                  "FROM word_posting " \
+                                  "WHERE word_id == ?"
+
+# language=SQL
+LIMITED_WORD_APPEARANCES_COUNT = "SELECT COUNT(*) " \
+                                 "FROM (SELECT 1 FROM word_appearance WHERE word_id == ? LIMIT ?)"
+
+# language=SQL
+WORD_LOCATIONS = "SELECT book_id, sentence, sentence_index " \
                  "FROM word_appearance " \
+                 "WHERE word_id == ?"
+
+# language=SQL
+WORD_AT_LOCATION = "SELECT word_id " \
+                   "FROM word_appearance " \
+                   "WHERE book_id == ? AND sentence == ? AND sentence_index == ?"
+
+# language=SQL
+FILTERED_POSTINGS = "SELECT word_id, book_id, positions " \
+                    "FROM word_posting " \
+                    "WHERE book_id {book_id_filter} AND word_id {word_id_filter}"
+
+# language=SQL
+ALL_BOOK_WORDS = "SELECT word_id, paragraph, sentence, line, line_offset " \
+                 "FROM {appearances_table} " \
                  "WHERE book_id == ? " \
                  "ORDER BY word_index"
 
 # language=SQL
-WORD_NAME_TO_ID = "SELECT word_id " \
-                  "FROM word " \
-                  "WHERE name == ?"
+ALL_WORD_NAMES_AND_IDS = "SELECT name, word_id " \
+                         "FROM word"
 
 # language=SQL
 WORD_LOCATION_TO_OFFSET = "SELECT line, line_offset " \
-                          "FROM word_appearance " \
+                          "FROM {appearances_table} " \
                           "WHERE book_id == ? AND sentence == ? AND sentence_index == ?"
 
 # language=SQL
 WORD_LOCATION_TO_END_OFFSET = "SELECT line, line_offset + length " \
-                              "FROM word_appearance NATURAL JOIN word " \
+                              "FROM {appearances_table} NATURAL JOIN word " \
                               "WHERE book_id == ? AND sentence == ? AND sentence_index == ?"
 
 # language=SQL
@@ -135,6 +278,33 @@ ALL_WORDS_IN_PHRASE = "SELECT word_id " \
                       "WHERE phrase_id == ? " \
                       "ORDER BY phrase_index"
 
+# language=SQL
+PHRASE_MATCHES = "SELECT book_id, sentence, start_index, end_index " \
+                 "FROM phrase_match " \
+                 "WHERE phrase_id == ? " \
+                 "ORDER BY book_id, sentence, start_index"
+
+# language=SQL
+PHRASE_MATCHES_WITH_OFFSETS = """
+SELECT phrase_match.book_id, title, phrase_match.sentence,
+    start_index, start_word.line, start_word.line_offset,
+    end_index, end_word.line, end_word.line_offset + length
+FROM phrase_match
+    JOIN book ON book.book_id == phrase_match.book_id
+    JOIN {appearances_table} AS start_word ON start_word.book_id == phrase_match.book_id
+        AND start_word.sentence == phrase_match.sentence AND start_word.sentence_index == start_index
+    JOIN {appearances_table} AS end_word ON end_word.book_id == phrase_match.book_id
+        AND end_word.sentence == phrase_match.sentence AND end_word.sentence_index == end_index
+    JOIN word ON word.word_id == end_word.word_id
+WHERE phrase_id == ?
+ORDER BY phrase_match.book_id, phrase_match.sentence, start_index
+"""
+
+# language=SQL
+ALL_PHRASES_WORDS = "SELECT phrase_id, word_id " \
+                    "FROM word_in_phrase " \
+                    "ORDER BY phrase_id, phrase_index"
+
 #
 # STATISTICS
 #
@@ -174,51 +344,121 @@ TOTAL_SIZE = "SELECT SUM(file_size) " \
              "FROM book"
 
 # language=SQL
-TOTAL_WORDS = "SELECT COUNT(word_index) " \
-              "FROM word_appearance " \
-              "WHERE book_id {book_id_filter}"
+BOOKS_STATISTICS_TOTALS = "SELECT IFNULL(SUM(words_count), 0), IFNULL(SUM(unique_words_count), 0), " \
+                          "IFNULL(SUM(letters_count), 0), IFNULL(SUM(paragraphs_count), 0), " \
+                          "IFNULL(SUM(lines_count), 0), IFNULL(SUM(sentences_count), 0) " \
+                          "FROM book_statistics " \
+                          "WHERE book_id {book_id_filter}"
 
 # language=SQL
-TOTAL_UNIQUE_WORDS = "SELECT COUNT(DISTINCT word_id) " \
-                     "FROM word_appearance " \
-                     "WHERE book_id {book_id_filter}"
+ALL_BOOKS_STATISTICS = "SELECT book_id, IFNULL(words_count, 0), IFNULL(unique_words_count, 0), " \
+                       "IFNULL(letters_count, 0), IFNULL(paragraphs_count, 0), IFNULL(lines_count, 0), " \
+                       "IFNULL(sentences_count, 0) " \
+                       "FROM book LEFT JOIN book_statistics USING (book_id)"
 
 # language=SQL
-TOTAL_LETTERS = "SELECT SUM(length) " \
-                "FROM word_appearance NATURAL JOIN word " \
-                "WHERE book_id {book_id_filter}"
+CORPUS_UNIQUE_WORDS = "SELECT COUNT(word_id) " \
+                      "FROM word " \
+                      "WHERE EXISTS (SELECT 1 FROM {appearances_table} WHERE word_id == word.word_id)"
+
+#
+# DECODED POSTINGS
+#
+
+# The decoded appearances of the postings needed by the recent queries, when the compressed storage is enabled.
+# Every table holds the postings matching other filters. They have the same columns as word_appearance,
+# so the appearances queries can run on them as well.
+
+# language=SQL
+CREATE_DECODED_APPEARANCE = """
+CREATE TEMP TABLE IF NOT EXISTS {decoded_table} (
+    word_id INTEGER NOT NULL,
+    book_id INTEGER NOT NULL,
+    word_index INTEGER NOT NULL,
+    paragraph INTEGER NOT NULL,
+    line INTEGER NOT NULL,
+    line_index INTEGER NOT NULL,
+    line_offset INTEGER NOT NULL,
+    sentence INTEGER NOT NULL,
+    sentence_index INTEGER NOT NULL
+);
+"""
 
 # language=SQL
-AVG_LETTERS_PER_WORD = "SELECT AVG(length) " \
-                       "FROM word_appearance NATURAL JOIN word " \
-                       "WHERE book_id {book_id_filter}"
+CREATE_DECODED_APPEARANCE_LOCATION = """
+CREATE INDEX IF NOT EXISTS temp.{decoded_table}_location
+    ON {decoded_table}(book_id, sentence, sentence_index);
+"""
 
 # language=SQL
-TOTAL_COLUMN_COUNT = """
-SELECT SUM(count_in_book) 
-FROM 
-    (SELECT COUNT(DISTINCT {count_column}) as count_in_book 
-    FROM word_appearance 
-    WHERE book_id {{book_id_filter}} 
-    GROUP BY book_id)
+INSERT_DECODED_APPEARANCE = """
+INSERT INTO {decoded_table}(word_id, book_id, word_index, paragraph, line, line_index, line_offset, sentence,
+                            sentence_index)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);
 """
 
 # language=SQL
-WORDS_COUNT = """
-SELECT AVG(words_count)
-FROM 
-    (SELECT COUNT(DISTINCT word_index) as words_count 
-    FROM word_appearance 
-    WHERE book_id {{book_id_filter}} 
-    GROUP BY {count_column})
+CLEAR_DECODED_APPEARANCE = "DELETE FROM {decoded_table}"
+
+# language=SQL
+COPY_FILTERED_DECODED_APPEARANCES = """
+INSERT INTO {decoded_table}(word_id, book_id, word_index, paragraph, line, line_index, line_offset, sentence,
+                            sentence_index)
+SELECT word_id, book_id, word_index, paragraph, line, line_index, line_offset, sentence, sentence_index
+FROM {source_table}{where};
 """
 
 # language=SQL
-LETTERS_COUNT = """
-SELECT AVG(letters_count)
-FROM 
-    (SELECT SUM(length) as letters_count
-    FROM word_appearance NATURAL JOIN word
-    WHERE book_id {{book_id_filter}}
-    GROUP BY {count_column})
+COPY_DECODED_APPEARANCES = """
+INSERT INTO word_appearance(word_id, book_id, word_index, paragraph, line, line_index, line_offset, sentence,
+                            sentence_index)
+SELECT word_id, book_id, word_index, paragraph, line, line_index, line_offset, sentence, sentence_index
+FROM {decoded_table};
 """
+
+#
+# DATABASE MANAGEMENT
+#
+
+# language=SQL
+SECONDARY_INDEXES = "SELECT name, sql " \
+                    "FROM sqlite_master " \
+                    "WHERE type == 'index' AND sql IS NOT NULL"
+
+# language=SQL
+SCHEMA_VERSION = "PRAGMA user_version"
+
+# language=SQL
+QUICK_CHECK = "PRAGMA quick_check"
+
+# language=SQL
+FOREIGN_KEY_CHECK = "PRAGMA foreign_key_check"
+
+# language=SQL
+TABLE_FOREIGN_KEY_CHECK = "PRAGMA foreign_key_check({table})"
+
+#
+# INDEX ADVISOR
+#
+
+# language=SQL
+EXPLAIN_QUERY_PLAN = "EXPLAIN QUERY PLAN {query}"
+
+# language=SQL
+TABLE_COLUMNS = "SELECT name " \
+                "FROM pragma_table_info(?)"
+
+# language=SQL
+CREATE_ADVISED_INDEX = "CREATE INDEX IF NOT EXISTS {name} ON {table}({columns})"
+
+#
+# TRIGRAM INDEX
+#
+
+# The ids of the texts which contain all the given trigrams, to be narrowed down further by LIKE
+# language=SQL
+TRIGRAM_CANDIDATES = "{id_column} IN (SELECT object_id " \
+                     "FROM text_trigram " \
+                     "WHERE source == ? AND trigram IN ({trigrams_placeholders}) " \
+                     "GROUP BY object_id " \
+                     "HAVING COUNT(*) == ?)"
@@ -0,0 +1,107 @@
+"""
+This file contains the trigram index of the searchable text columns.
+Every text is indexed by all its substrings of 3 characters, so the texts a LIKE pattern can match are narrowed down
+to those containing all the trigrams of the literal parts of the pattern, before the pattern itself is checked.
+"""
+
+import collections
+import string
+
+import db.sql_queries as queries
+from db.query_builder import LIKE_ESCAPE, Like, MemberOf, to_filter
+
+# The length of the indexed substrings
+TRIGRAM_LENGTH = 3
+
+# The wildcards of LIKE, which separate the literal parts of a pattern
+LIKE_WILDCARDS = "%_"
+
+# LIKE ignores the case of ASCII letters only, so only they are lowered in the trigrams
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+# The source numbers of the indexed columns in the trigram table
+WORD_NAME_SOURCE = 0
+BOOK_TITLE_SOURCE = 1
+BOOK_AUTHOR_SOURCE = 2
+
+# An indexed column: its source number, and the id column of its table which the trigrams point to
+IndexedColumn = collections.namedtuple("IndexedColumn", ["source", "id_column"])
+
+# Maps the (table, column) of every indexed column to its IndexedColumn
+INDEXED_COLUMNS = {
+    ("word", "name"): IndexedColumn(WORD_NAME_SOURCE, "word_id"),
+    ("book", "title"): IndexedColumn(BOOK_TITLE_SOURCE, "book_id"),
+    ("book", "author"): IndexedColumn(BOOK_AUTHOR_SOURCE, "book_id")
+}
+
+
+def text_trigrams(text):
+    """
+    :param text: The text
+    :return: Set of all the trigrams of the text, lowered like LIKE compares them.
+        These are the trigrams INSERT_TEXT_TRIGRAMS inserts for the text.
+    """
+    text = text.translate(ASCII_LOWER)
+    return {text[index:index + TRIGRAM_LENGTH] for index in range(len(text) - TRIGRAM_LENGTH + 1)}
+
+
+def pattern_trigrams(pattern):
+    """
+    Find the trigrams every text matched by a LIKE pattern contains, which are the trigrams of its literal parts.
+    :param pattern: LIKE pattern, escaped with LIKE_ESCAPE
+    :return: Set of the trigrams. Empty if the pattern has no literal part of 3 characters.
+    """
+    trigrams = set()
+    literal = []
+    chars = iter(pattern)
+    for char in chars:
+        if char == LIKE_ESCAPE:
+            literal.append(next(chars, ''))
+        elif char in LIKE_WILDCARDS:
+            trigrams |= text_trigrams(''.join(literal))
+            literal = []
+        else:
+            literal.append(char)
+
+    return trigrams | text_trigrams(''.join(literal))
+
+
+class TrigramLike(collections.namedtuple("TrigramLike", ["pattern", "source", "id_column"])):
+    """
+    Match the rows where an indexed column matches a LIKE pattern, as Like does.
+    The rows are first narrowed down by the trigram index, so only the candidates are checked against the pattern.
+    """
+
+    def to_sql(self, col_name):
+        like, like_params = Like(self.pattern).to_sql(col_name)
+        trigrams = tuple(sorted(pattern_trigrams(self.pattern)))
+        if not trigrams:
+            # Every text may match the pattern
+            return like, like_params
+
+        candidates = queries.TRIGRAM_CANDIDATES.format(id_column=self.id_column,
+                                                       trigrams_placeholders=", ".join("?" * len(trigrams)))
+        return f'{candidates} AND {like}', (self.source,) + trigrams + (len(trigrams),) + like_params
+
+
+def use_trigram_index(tables, filters):
+    """
+    Replace the LIKE filters on the indexed columns with TrigramLike filters, including in nested MemberOf filters.
+    :param tables: The tables the filters apply to
+    :param filters: Dict that maps columns to their filters, as in build_query
+    :return: Dict of the new filters
+    """
+    indexed_columns = {column: indexed_column for (table, column), indexed_column in INDEXED_COLUMNS.items()
+                       if table in tables}
+
+    new_filters = {}
+    for col_name, value in filters.items():
+        value_filter = to_filter(value)
+        if isinstance(value_filter, MemberOf):
+            value = MemberOf(value_filter.table, value_filter.column,
+                             **use_trigram_index((value_filter.table,), value_filter.filters))
+        elif isinstance(value_filter, Like) and col_name in indexed_columns:
+            value = TrigramLike(value_filter.pattern, *indexed_columns[col_name])
+        new_filters[col_name] = value
+
+    return new_filters
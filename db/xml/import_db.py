@@ -132,9 +132,15 @@ def import_db(db, xml_path):  # type: (BookDatabase, str) -> None
     # Start an empty connection database
     db.new_connection()
 
-    # Initialize all the tables
+    # Initialize all the tables in a single fast load session
     root = tree.getroot()
-    init_words(db, root.find("words"))
-    init_books(db, root.find("books"))
-    init_groups(db, root.find("groups"))
-    init_phrases(db, root.find("phrases"))
+    with db.fast_load():
+        init_words(db, root.find("words"))
+        init_books(db, root.find("books"))
+        init_groups(db, root.find("groups"))
+        init_phrases(db, root.find("phrases"))
+
+    # Read the imported books only after the indexes were rebuilt
+    db.update_books_statistics()
+    db.update_books_vocabulary()
+    db.update_phrase_matches()
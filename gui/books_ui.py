@@ -43,6 +43,16 @@ class BooksUi:
 
     LOADING_SUCCESS = "Successfully loaded from file."
 
+    NO_INDEX_ADVICE = "The searches done so far don't need any new index."
+
+    INDEX_ADVICE = "These indexes would speed up the searches done so far:\n\n" \
+                   "{advices}\n\n" \
+                   "Do you wish to create them?\n"
+
+    INDEX_ADVICE_LINE = "{table}({columns}) - {executions} searches"
+
+    INDEXES_CREATED = "Created {count} indexes, which sped up {helped} of {total} searches."
+
     # The tabs
     TAB_CLASSES = BookTab, WordTab, GroupTab, PhraseTab, StatisticsTab
 
@@ -54,6 +64,7 @@ class BooksUi:
         SAVE_AS_BUTTON = auto()
         IMPORT_BUTTON = auto()
         EXPORT_BUTTON = auto()
+        OPTIMIZE_BUTTON = auto()
         TABS = auto()
 
     def __init__(self):
@@ -79,9 +90,15 @@ class BooksUi:
             BooksUi.KEYS.SAVE_BUTTON: functools.partial(self._save_database, True),
             BooksUi.KEYS.SAVE_AS_BUTTON: functools.partial(self._save_database, False),
             BooksUi.KEYS.IMPORT_BUTTON: self.import_database,
-            BooksUi.KEYS.EXPORT_BUTTON: self._export_database
+            BooksUi.KEYS.EXPORT_BUTTON: self._export_database,
+            BooksUi.KEYS.OPTIMIZE_BUTTON: self._advise_indexes
         }
 
+        # The events posted by the background work of the tabs are handled by their tabs, whichever tab is selected
+        self.background_callbacks = {event: callback
+                                     for row in self.tabs.Rows for tab in row
+                                     for event, callback in tab.background_callbacks.items()}
+
     @staticmethod
     def _create_menu_buttons_row():
         new_button = sg.Button(
@@ -114,7 +131,12 @@ class BooksUi:
             key=BooksUi.KEYS.EXPORT_BUTTON
         )
 
-        return [new_button, load_button, save_button, save_as_button, import_button, export_button]
+        optimize_button = sg.Button(
+            button_text="Optimize",
+            key=BooksUi.KEYS.OPTIMIZE_BUTTON
+        )
+
+        return [new_button, load_button, save_button, save_as_button, import_button, export_button, optimize_button]
 
     def _reload_tabs(self):
         """ Reload all the tabs with the content from the database """
@@ -181,6 +203,23 @@ class BooksUi:
         if path:
             export_db(self.db, path)
 
+    def _advise_indexes(self):
+        """ Show the indexes advised for the searches done so far, and create them if requested """
+        advices = self.db.index_advisor.recommend()
+        if not advices:
+            sg.popup_ok(self.NO_INDEX_ADVICE, title="Optimize")
+            return
+
+        advices_str = "\n".join(self.INDEX_ADVICE_LINE.format(table=advice.table, columns=", ".join(advice.columns),
+                                                              executions=advice.executions)
+                                for advice in advices)
+        if sg.popup_yes_no(self.INDEX_ADVICE.format(advices=advices_str), title="Optimize") == "Yes":
+            results = self.db.index_advisor.create_indexes(advices)
+            sg.popup_ok(self.INDEXES_CREATED.format(count=len(results),
+                                                    helped=sum(len(helped) for _advice, helped in results),
+                                                    total=sum(len(advice.queries) for advice, _helped in results)),
+                        title="Optimize")
+
     def import_database(self):
         """ Import the database from a XML file """
         if sg.popup_yes_no(self.UNSAVED_DATA_WARNING, title="Import") == "Yes":
@@ -233,13 +272,15 @@ class BooksUi:
         # self.debug_init_db()
 
         while True:
-            event = self.window.read()[0]
+            event, values = self.window.read()
 
             if event is None:
                 # Window was closed
                 break
             elif event in self.callbacks:
                 self.callbacks[event]()
+            elif event in self.background_callbacks:
+                self.background_callbacks[event](values[event])
             else:
                 # Forward the event to the current selected tab
                 curr_tab = self.window.Element(self.tabs.get())  # type: CustomTab
@@ -7,6 +7,7 @@ import PySimpleGUI as sg
 #
 
 CENTER = tk.CENTER
+END = tk.END
 
 #
 # My constants
@@ -22,6 +23,7 @@ BIG_FONT_SIZE = None, 17
 TITLE_FONT_SIZE = BIG_FONT_SIZE
 HUGE_FONT_SIZE = None, 20
 BORDER_SIZE = 2
+SCROLL_END_FRACTION = 0.9  # The part of a scrollable element which is considered its end
 NO_BG = "#"
 
 #
@@ -82,3 +84,22 @@ def get_theme_field(field):
     :return: The field value if it exists, else None
     """
     return THEME.get(field)
+
+
+def bind_scroll_end(widget, callback):
+    """
+    Call a function whenever a scrollable widget is scrolled to its end, or all of its content is visible.
+    The scrollbar of the widget is updated as before.
+    :param widget: The tkinter widget, such as a Listbox or a Treeview
+    :param callback: The function to call, without arguments
+    """
+    scrollbar_command = str(widget["yscrollcommand"])
+
+    def _on_scroll(first, last):
+        if scrollbar_command:
+            widget.tk.eval(f"{scrollbar_command} {first} {last}")
+
+        if float(last) >= SCROLL_END_FRACTION:
+            callback()
+
+    widget.configure(yscrollcommand=_on_scroll)
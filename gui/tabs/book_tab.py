@@ -6,7 +6,9 @@ from subprocess import Popen
 import PySimpleGUI as sg
 
 import gui.simple_gui_helper as sgh
+from db.books_db import BookDatabase
 from db.exceptions import NonUniqueError, CheckError
+from db.query_builder import escape_like, MemberOf
 from gui.tabs.custom_tab import CustomTab
 from utils.book_parser import parse_book_file
 from utils.constants import DATE_FORMAT
@@ -26,6 +28,12 @@ class BookTab(CustomTab):
         BOOKS_TABLE = auto()
         OPEN_BOOK = auto()
 
+    # The wildcard of the word filter, which matches any text
+    WORD_WILDCARD = "*"
+
+    # The syntax of the word filter
+    WORD_FILTER_TOOLTIP = "Text inside a word, or a pattern with * wildcards (run* for the words starting with run)"
+
     def __init__(self, db):
         super().__init__(db, "Insert Book", [[]])
         self.db.add_book_insert_callback(self._update_books_table)
@@ -69,18 +77,20 @@ class BookTab(CustomTab):
         return frame
 
     def _create_books_filter_row(self):
-        def _create_filter_input():
+        def _create_filter_input(tooltip):
             return sg.InputText(
                 default_text="",
                 size=(20, 1),
                 enable_events=True,
+                tooltip=tooltip,
                 key=BookTab.EventKeys.UPDATE_FILTER
             )
 
         row = []
         self.str_filters = []
-        for text, filter_name in ("Title", "title"), ("Author", "author"), ("Word Appearance", "name"):
-            element = _create_filter_input()
+        for text, filter_name, tooltip in (("Title", "title", None), ("Author", "author", None),
+                                           ("Word Appearance", "name", BookTab.WORD_FILTER_TOOLTIP)):
+            element = _create_filter_input(tooltip)
             row += [sg.Text(f"{text}: ", pad=((20, 5), 10)), element]
             self.str_filters.append((filter_name, element))
 
@@ -202,27 +212,26 @@ class BookTab(CustomTab):
         """ Update the dynamic filters for the books list"""
         for filter_name, element in self.str_filters:
             letters_filter = element.get()
-            if letters_filter:
-                letters_filter = letters_filter.replace("\"", "\"\"")  # Escape all '"'
-                letters_filter = letters_filter.replace("\\", "\\\\")  # Escape all '\'
-                letters_filter = letters_filter.replace("%", "\\%")  # Escape all '%'
-                letters_filter = letters_filter.replace("_", "\\_")  # Escape all '_'
-                self.filters[filter_name] = f"%{letters_filter}%"
+            if filter_name == "name" and BookTab.WORD_WILDCARD in letters_filter:
+                self.filters[filter_name] = escape_like(letters_filter).replace(BookTab.WORD_WILDCARD, "%")
+            elif letters_filter:
+                self.filters[filter_name] = f"%{escape_like(letters_filter)}%"
             else:
                 self.filters[filter_name] = None
 
         self._update_books_table()
 
-    def _get_books_filter_tables(self):
-        """ Return the additional tables needed for the current filters"""
-        filter_tables = []
-        if self.filters["name"]:
-            filter_tables += ["word", "word_appearance"]
-        return filter_tables
-
     def _update_books_table(self):
         """ Update the books list shown """
-        books = self.db.search_books(tables=self._get_books_filter_tables(), **self.filters)
+        filters = self.filters.copy()
+
+        # Only the books containing the matching words, which are looked up in the vocabularies of the books
+        # instead of in all their appearances
+        word_filter = filters.pop("name", None)
+        if word_filter:
+            filters["book_id"] = MemberOf(BookDatabase.VOCABULARY_TABLE, word_id=MemberOf("word", name=word_filter))
+
+        books = self.db.search_books(**filters)
         self.books_table.update(values=[book[:5] + (file_size_to_str(book[5]),) for book in books])
 
     def _select_book(self):
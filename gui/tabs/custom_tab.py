@@ -26,6 +26,14 @@ class CustomTab(sg.Tab):
         """ Maps the different event keys to the handler functions """
         return {}
 
+    @property
+    def background_callbacks(self):
+        """
+        Maps the keys of the events posted by the background work of the tab to the handler functions.
+        They are handled even when the tab isn't selected, and get the value posted with the event.
+        """
+        return {}
+
     def handle_enter(self, focused_element):
         """
         Handle an enter press.
@@ -208,18 +208,8 @@ class PhraseTab(CustomTab):
 
         # Check if there is a selected phrase
         if self.selected_phrase_id:
-            appearances = self.db.find_phrase(self.selected_phrase_id)
-
-            # Iterate over the found phrases and convert them to the wanted table columns
-            phrases_appr_table_values = []
-            for book_id, sentence, start_index, end_index in appearances:
-                start_line, start_line_offset = self.db.word_location_to_offset(book_id, sentence, start_index)
-                end_line, end_line_offset = self.db.word_location_to_offset(book_id, sentence, end_index, True)
-
-                phrases_appr_table_values.append((book_id, self.db.get_book_title(book_id)[0],
-                                                  sentence,
-                                                  start_index, start_line, start_line_offset,
-                                                  end_index, end_line, end_line_offset))
+            # The appearances are already in the wanted table columns
+            phrases_appr_table_values = self.db.get_phrase_matches_with_offsets(self.selected_phrase_id)
 
             self.appearances_count_text.update(value=f"Number of Appearances: {len(phrases_appr_table_values)}")
             self.phrase_appr_table.update(values=phrases_appr_table_values)
@@ -1,14 +1,15 @@
+import sqlite3
+import threading
 from enum import Enum, auto
 
 import PySimpleGUI as sg
 
 import db.sql_queries as queries
 import gui.simple_gui_helper as sgh
+from db.books_db import BookDatabase
 from gui.tabs.custom_tab import CustomTab
 from utils.utils import float_to_str, file_size_to_str
 
-ALL_BOOKS_FILTER = "> 0"
-
 
 class StatisticsTab(CustomTab):
     """
@@ -25,34 +26,44 @@ class StatisticsTab(CustomTab):
         ("Average Words in Phrase", queries.AVG_WORDS_PER_PHRASE)
     )
 
-    # Specific statistics about a book (or all books)
+    # Specific statistics about a book (or all books), by their names in BookDatabase.get_books_statistics
     SPECIFIC_STATISTICS = (
-        ("Total Words", queries.TOTAL_WORDS),
-        ("Total Unique Words", queries.TOTAL_UNIQUE_WORDS),
-        ("Total Letters", queries.TOTAL_LETTERS),
-        ("Average Letters in Word", queries.AVG_LETTERS_PER_WORD)
+        ("Total Words", "words"),
+        ("Total Unique Words", "unique_words"),
+        ("Total Letters", "letters"),
+        ("Average Letters in Word", "letters_per_word")
     )
 
-    # Specific statistics template to be replaced with a column name
+    # Specific statistics template to be replaced with a book part name
     SPECIFIC_STATISTICS_TEMPLATE = (
-        ("Total {count_column}s", queries.TOTAL_COLUMN_COUNT),
-        ("Average Words in {count_column}", queries.WORDS_COUNT),
-        ("Average Letters in {count_column}", queries.LETTERS_COUNT)
+        ("Total {count_column}s", "{count_column}s"),
+        ("Average Words in {count_column}", "words_per_{count_column}"),
+        ("Average Letters in {count_column}", "letters_per_{count_column}")
     )
 
+    # The message of the error raised by the queries that were aborted by Database.interrupt
+    INTERRUPTED_ERROR = "interrupted"
+
     # Event keys
     class EventKeys(Enum):
         SELECT_BOOK = auto()
+        REFRESH_STATISTICS = auto()
+        STATISTICS_READY = auto()
 
     def __init__(self, db):
         super().__init__(db, "Statistics", [[]])
         self.db.add_book_insert_callback(self._update_book_dropdown)
-        self.db.add_group_insert_callback(self._refresh_general_statistics)
-        self.db.add_group_word_insert_callback(self._refresh_general_statistics)
-        self.db.add_phrase_insert_callback(self._refresh_general_statistics)
+        self.db.add_group_insert_callback(self._request_statistics_refresh)
+        self.db.add_group_word_insert_callback(self._request_statistics_refresh)
+        self.db.add_phrase_insert_callback(self._request_statistics_refresh)
 
         self.selected_book_id = None
         self.book_names_to_id = {}
+        self.statistics_matrix = {}  # The statistics of every book, and of all the books (under None)
+
+        self.refresh_number = 0  # Identifies the latest refresh request, so older results are ignored
+        self.refresh_pending = False  # Was a refresh requested, but not started yet
+        self.statistics_reader = None  # The database copy of the running refresh
         self.layout(
             [
                 [sg.Sizer(v_pixels=20)],
@@ -63,10 +74,10 @@ class StatisticsTab(CustomTab):
         )
 
     @staticmethod
-    def _create_elements(elements_list, title, query, font=sgh.MEDIUM_FONT_SIZE):
+    def _create_elements(elements_list, title, statistic, font=sgh.MEDIUM_FONT_SIZE):
         result_text = sg.Text(text="0", size=(10, 1), pad=(0, 5), font=font, text_color=sgh.INPUT_COLOR)
         title_text = sg.Text(text=title + ": ", size=(25, 1), font=font)
-        elements_list.append((title, result_text, query))
+        elements_list.append((title, result_text, statistic))
         return title_text, result_text
 
     def _create_general_statistics_frame(self):
@@ -104,20 +115,21 @@ class StatisticsTab(CustomTab):
 
         self.specific_statistics = []
         first_rows = []
-        for rows_counter, (title, query) in enumerate(StatisticsTab.SPECIFIC_STATISTICS):
-            title_text, result_text = self._create_elements(self.specific_statistics, title, query, sgh.BIG_FONT_SIZE)
+        for rows_counter, (title, statistic) in enumerate(StatisticsTab.SPECIFIC_STATISTICS):
+            title_text, result_text = self._create_elements(self.specific_statistics, title, statistic,
+                                                            sgh.BIG_FONT_SIZE)
 
             first_rows.append([title_text, result_text])
             if rows_counter % 2 == 1:
                 first_rows.append([sg.Sizer(v_pixels=20)])
 
         second_cols = []
-        for column in "paragraph", "line", "sentence":
+        for column in BookDatabase.STATISTICS_PARTS:
             col_rows = []
-            for title, query in StatisticsTab.SPECIFIC_STATISTICS_TEMPLATE:
+            for title, statistic in StatisticsTab.SPECIFIC_STATISTICS_TEMPLATE:
                 title_text, result_text = self._create_elements(self.specific_statistics,
                                                                 title.format(count_column=column.title()),
-                                                                query.format(count_column=column))
+                                                                statistic.format(count_column=column))
 
                 col_rows.append([title_text, result_text])
             second_cols.append(sg.Column(layout=col_rows))
@@ -144,6 +156,7 @@ class StatisticsTab(CustomTab):
 
     def reload(self):
         self.selected_book_id = None
+        self.statistics_matrix = {}
         self._update_book_dropdown()
         self.books_dropdown.update(value="All")
 
@@ -153,6 +166,13 @@ class StatisticsTab(CustomTab):
             StatisticsTab.EventKeys.SELECT_BOOK: self._select_book,
         }
 
+    @property
+    def background_callbacks(self):
+        return {
+            StatisticsTab.EventKeys.REFRESH_STATISTICS: self._start_statistics_refresh,
+            StatisticsTab.EventKeys.STATISTICS_READY: self._show_statistics
+        }
+
     def _update_book_dropdown(self):
         """ Update the list of available books """
         books = self.db.all_books()
@@ -161,12 +181,8 @@ class StatisticsTab(CustomTab):
         book_options = ["All"] + list(self.book_names_to_id.keys())
         self.books_dropdown.update(values=book_options, value=self.books_dropdown.get())
 
-        # If the list of books was updated, the general statistics also needs to be updated
-        self._refresh_general_statistics()
-
-        # Update the specific statistics if "All" are selected
-        if self.selected_book_id is None:
-            self._refresh_specific_statistics()
+        # If the list of books was updated, the general statistics and the books statistics also need to be updated
+        self._request_statistics_refresh()
 
     def _select_book(self):
         """ Select a book from the list """
@@ -177,25 +193,79 @@ class StatisticsTab(CustomTab):
         if len(self.book_names_to_id) > 1 and self.selected_book_id != old_id:
             self._refresh_specific_statistics()
 
-    @staticmethod
-    def _single_result_to_str(cursor):
-        # Fetch one result from the cursor and select the first column
-        result = cursor.fetchone()[0]
-        return float_to_str(result, ndigits=3)
-
-    def _refresh_general_statistics(self, _updated_group=None):
-        """ Re-calculate all the general statistics """
-        for _text, element, query in self.general_statistics:
-            result = self.db.execute(query)
+    def _request_statistics_refresh(self, _updated_group=None):
+        """
+        Request to re-calculate all the statistics in the background.
+        The running calculation is aborted, since its results are outdated.
+        The new calculation starts once the window handles its events, so a burst of requests starts it once.
+        """
+        self.refresh_number += 1
+        if self.statistics_reader:
+            self.statistics_reader.interrupt()
+
+        if not self.refresh_pending:
+            self.refresh_pending = True
+            self.ParentForm.write_event_value(StatisticsTab.EventKeys.REFRESH_STATISTICS, None)
+
+    def _start_statistics_refresh(self, _value):
+        """ Start the requested calculation of the statistics in a worker thread """
+        self.refresh_pending = False
+        self.statistics_reader = self.db.reader()
+        threading.Thread(target=self._calculate_statistics,
+                         args=(self.statistics_reader, self.refresh_number),
+                         daemon=True).start()
+
+    def _calculate_statistics(self, db_reader, refresh_number):
+        """
+        Calculate all the statistics, and post them to the window in a STATISTICS_READY event.
+        Runs in a worker thread.
+        :param db_reader: Read only copy of the database, which is closed when done
+        :param refresh_number: The number of the refresh request
+        """
+        try:
+            with db_reader:
+                general_statistics = []
+                for _text, _element, query in self.general_statistics:
+                    # Stop if a newer refresh was requested, even if it happened between the queries
+                    if refresh_number != self.refresh_number:
+                        return
+                    general_statistics.append(db_reader.execute(query).fetchone()[0])
+
+                statistics_matrix = db_reader.get_statistics_matrix()
+        except sqlite3.OperationalError as error:
+            # The calculation was aborted by a newer refresh
+            if str(error) == StatisticsTab.INTERRUPTED_ERROR:
+                return
+            raise
+
+        self.ParentForm.write_event_value(StatisticsTab.EventKeys.STATISTICS_READY,
+                                          (refresh_number, general_statistics, statistics_matrix))
+
+    def _show_statistics(self, results):
+        """
+        Show the statistics calculated by the worker thread.
+        :param results: The refresh number, the general statistics and the statistics matrix
+        """
+        refresh_number, general_statistics, statistics_matrix = results
+        if refresh_number != self.refresh_number:
+            # A newer refresh was requested, so these statistics are outdated
+            return
+
+        self.statistics_reader = None
+        for (_text, element, query), result in zip(self.general_statistics, general_statistics):
             if query == queries.TOTAL_SIZE:
-                element.update(value=file_size_to_str(result.fetchone()[0]))
+                element.update(value=file_size_to_str(result))
             else:
-                element.update(value=self._single_result_to_str(result))
+                element.update(value=float_to_str(result, ndigits=3))
+
+        self.statistics_matrix = statistics_matrix
+        self._refresh_specific_statistics()
 
     def _refresh_specific_statistics(self):
-        """ Re-calculate all the specific statistics about the currently selected book """
-        book_id_filter = ALL_BOOKS_FILTER if self.selected_book_id is None else f"== {self.selected_book_id}"
+        """ Show all the specific statistics about the currently selected book """
+        statistics = self.statistics_matrix.get(self.selected_book_id)
+        if statistics is None:
+            statistics = self.db.get_books_statistics(self.selected_book_id)
 
-        for _text, element, query in self.specific_statistics:
-            result = self.db.execute(query.format(book_id_filter=book_id_filter))
-            element.update(value=self._single_result_to_str(result))
+        for _text, element, statistic in self.specific_statistics:
+            element.update(value=float_to_str(statistics[statistic], ndigits=3))
@@ -1,3 +1,4 @@
+import functools
 from enum import Enum, auto
 from threading import Timer
 
@@ -5,6 +6,7 @@ import PySimpleGUI as sg
 
 import gui.simple_gui_helper as sgh
 from db.books_db import BookDatabase
+from db.query_builder import escape_like, In, MemberOf, Page, Range
 from gui.book_context_manager import BookPreview
 from gui.tabs.custom_tab import CustomTab
 
@@ -37,9 +39,21 @@ class WordTab(CustomTab):
                               "Use  _  as a wildcard for any character.\n" \
                               "Use  *   as a wildcard for 0 or more characters."
 
+    # The syntax of the number filters
+    NUMBER_FILTER_TOOLTIP = "A number (5), a range (10-20) or a list of numbers (1,3,5)"
+
     # The amount of time without typing required for updating the filter
     FILTER_UPDATE_SCHEDULE_TIME = 0.5
 
+    # The number of words and appearances loaded at once, whenever their lists are scrolled to the end
+    WORDS_PAGE_SIZE = 200
+    APPEARANCES_PAGE_SIZE = 100
+
+    # The columns of the words list and the appearances table
+    WORDS_COLUMNS = ["word_id", "length", "name", "COUNT(word_index)"]
+    APPEARANCES_COLUMNS = ["book_id", "line_offset", "word_index", "paragraph", "line", "line_index", "sentence",
+                           "sentence_index"]
+
     # Event keys
     class EventKeys(Enum):
         UPDATE_FILTER = auto()
@@ -50,6 +64,8 @@ class WordTab(CustomTab):
         WORDS_DIRECTION = auto()
         WORDS_LIST = auto()
         APPR_TABLE = auto()
+        LOAD_WORDS_PAGE = auto()
+        LOAD_APPR_PAGE = auto()
 
     def __init__(self, db):
         super().__init__(db, "View Words", [[]])
@@ -69,13 +85,20 @@ class WordTab(CustomTab):
 
         self.words_list = []
         self.book_names_to_id = {}
-        self.group_name_to_id = {"All": "%"}
+        self.group_name_to_id = {"All": None}  # "All" matches the words in any group
         self.curr_showed_book = None
         self.selected_word_id = None
         self.selected_word_length = None
         self.words_filters = {}
         self.word_appearance_filters = {}
 
+        # The search arguments of the shown lists, and the pages that continue them (None if fully loaded)
+        self.words_search_args = {}
+        self.next_words_page = None
+        self.appr_search_args = {}
+        self.next_appr_page = None
+        self.requested_pages = set()  # The event keys of the pages requested to be loaded
+
         self.layout([
             [self._create_filter_frame()],
             [self._create_word_list_column(), self._create_word_preview_column()]
@@ -128,6 +151,7 @@ class WordTab(CustomTab):
                 enable_events=True,
                 background_color=sgh.THEME["INPUT"],
                 text_color=sgh.INPUT_COLOR,
+                tooltip=WordTab.NUMBER_FILTER_TOOLTIP,
                 key=WordTab.EventKeys.SCHEDULE_UPDATE_FILTER
             )
 
@@ -301,6 +325,13 @@ class WordTab(CustomTab):
 
     def initialize(self):
         self.book_preview.initialize()
+
+        # Load the next pages of the lists when they are scrolled to the end
+        sgh.bind_scroll_end(self.select_word_list.TKListbox,
+                            functools.partial(self._request_page, WordTab.EventKeys.LOAD_WORDS_PAGE))
+        sgh.bind_scroll_end(self.word_appr_table.TKTreeview,
+                            functools.partial(self._request_page, WordTab.EventKeys.LOAD_APPR_PAGE))
+
         self.reload()
 
     def reload(self):
@@ -333,6 +364,13 @@ class WordTab(CustomTab):
             WordTab.EventKeys.APPR_TABLE: self._select_word_appr
         }
 
+    @property
+    def background_callbacks(self):
+        return {
+            WordTab.EventKeys.LOAD_WORDS_PAGE: self._load_words_page,
+            WordTab.EventKeys.LOAD_APPR_PAGE: self._load_word_appr_page
+        }
+
     @staticmethod
     def _show_regex_help():
         """ Show a popup window with help message about the word search syntax """
@@ -357,7 +395,7 @@ class WordTab(CustomTab):
 
     def _update_group_dropdown(self):
         """ Update the list of available groups """
-        self.group_name_to_id = {"All": "%"}
+        self.group_name_to_id = {"All": None}  # "All" matches the words in any group
         groups_list = self.db.all_groups()
         self.group_name_to_id.update({name: group_id for group_id, name in groups_list})
 
@@ -372,7 +410,8 @@ class WordTab(CustomTab):
     def _group_word_insertion_callback(self, group_id):
         """ Handle the insertion of a word to a group """
         # If the group filter contains the group_id, we need to update the words list
-        if self.words_filters["group_id"] in (group_id, "%"):
+        group_filter = self.words_filters.get("word_id")
+        if group_filter is not None and group_filter.filters.get("group_id") in (group_id, None):
             self._update_words_list()
 
     def _cancel_filter_scheduler(self):
@@ -426,13 +465,15 @@ class WordTab(CustomTab):
 
         # Words filters
         selected_group = self.group_filter_dropdown.get()
-        self.words_filters["group_id"] = self.group_name_to_id.get(selected_group)
+        if selected_group in self.group_name_to_id:
+            # Only the words in the selected group (or in any group), which are looked up by their ids
+            self.words_filters["word_id"] = MemberOf("word_in_group",
+                                                     group_id=self.group_name_to_id[selected_group])
+        else:
+            self.words_filters["word_id"] = None
 
         letters_filter = self.letters_filter_input.get()
-        letters_filter = letters_filter.replace("\"", "\"\"")  # Escape all '"'
-        letters_filter = letters_filter.replace("\\", "\\\\")  # Escape all '\'
-        letters_filter = letters_filter.replace("%", "\\%")  # Escape all '%'
-        letters_filter = letters_filter.replace("*", "%")
+        letters_filter = escape_like(letters_filter, wildcards="%").replace("*", "%")  # '_' is a wildcard as well
         self.words_filters["name"] = letters_filter
 
         # Word appearance filters
@@ -445,16 +486,33 @@ class WordTab(CustomTab):
             self._update_words_list()
             self.old_word_appearance_filters = self.word_appearance_filters.copy()
 
+    @staticmethod
+    def _parse_number_filter(text):
+        """
+        Convert the text of a number filter to a filter, as described in NUMBER_FILTER_TOOLTIP.
+        :param text: The text to convert
+        :raises ValueError: If the text isn't a valid number filter
+        :return: The number, or a Range or In filter
+        """
+        if "-" in text:
+            # A missing bound leaves the range open on its side
+            minimum, maximum = (int(bound) if bound.strip() else None for bound in text.split("-"))
+            return Range(minimum, maximum)
+        elif "," in text:
+            return In(int(number) for number in text.split(","))
+        else:
+            return int(text)
+
     @staticmethod
     def _get_int_input(input_element, default_value):
         """
-        Try to convert the input element text to an integer.
+        Try to convert the input element text to a number filter.
         Change the element background to indicate illegal input.
         """
         int_input = default_value
         entered_number = input_element.get()
         try:
-            int_input = int(entered_number)
+            int_input = WordTab._parse_number_filter(entered_number)
             legal_number = True
         except ValueError:
             legal_number = len(entered_number) == 0
@@ -484,27 +542,53 @@ class WordTab(CustomTab):
             if self.curr_words_direction != old_dir:
                 self._update_words_list()
 
-    def _get_words_filter_tables(self):
-        """ Get the additional tables needed for creating the list of matched words """
-        filter_tables = []
-        if self.words_filters.get("group_id") is not None:
-            filter_tables.append("word_in_group")
-        return filter_tables
+    def _request_page(self, event_key):
+        """
+        Request to load the next page of a list, once the window handles its events.
+        The scrolling goes on while the page is loaded, so the page is requested only once.
+        :param event_key: The event key of the page loading
+        """
+        if event_key not in self.requested_pages:
+            self.requested_pages.add(event_key)
+            self.ParentForm.write_event_value(event_key, None)
 
     def _update_words_list(self):
         """ Update the matched words list """
-        self.words_list = self.db.search_word_appearances(
-            cols=["word_id", "length", "name", "COUNT(word_index)"],
-            tables=set(["word"] + self._get_words_filter_tables()),
+        self.words_search_args = dict(
+            tables={"word"},
             unique_words=True,
-            order_by=self.curr_words_order + " " + self.curr_words_direction,
             **self.words_filters,
             **self.word_appearance_filters)
 
-        self.words_counter_text.update(f"{len(self.words_list):,} Result{'s' if len(self.words_list) != 1 else ''}.")
-        self.select_word_list.update(values=[f'{word[2]} ({word[3]:,})' for word in self.words_list])
+        # The words are counted without fetching them, since only their first page is loaded
+        words_count = self.db.count_word_appearances(**self.words_search_args)
+        self.words_counter_text.update(f"{words_count:,} Result{'s' if words_count != 1 else ''}.")
+
+        self.words_list = []
+        self.select_word_list.update(values=[])
+        self.next_words_page = Page((self.curr_words_order, "word_id"), WordTab.WORDS_PAGE_SIZE,
+                                    descending=self.curr_words_direction == "desc")
+        self._load_words_page()
         self._select_word()
 
+    def _load_words_page(self, _value=None):
+        """ Load the next page of the matched words list, if it wasn't fully loaded """
+        self.requested_pages.discard(WordTab.EventKeys.LOAD_WORDS_PAGE)
+        if self.next_words_page is None:
+            return
+
+        words, self.next_words_page = self.db.search_word_appearances(
+            cols=WordTab.WORDS_COLUMNS,
+            page=self.next_words_page,
+            **self.words_search_args)
+
+        # The words are added to the end of the list, so it keeps its scroll position and selection
+        words_values = [f'{word[2]} ({word[3]:,})' for word in words]
+        self.words_list += words
+        self.select_word_list.Values = list(self.select_word_list.Values) + words_values
+        if words_values:
+            self.select_word_list.TKListbox.insert(sgh.END, *words_values)
+
     def _select_word(self):
         """ Select a word from the list to view its appearances """
         select_word_list_indexes = self.select_word_list.get_indexes()
@@ -522,19 +606,16 @@ class WordTab(CustomTab):
 
     def _update_word_appr_table(self):
         """ Update the word appearances table """
+        self.word_appr_table.update(values=[])
         if self.selected_word_id:
-            appearances = self.db.search_word_appearances(
-                cols=["book_id", "line_offset", "word_index", "paragraph", "line", "line_index", "sentence",
-                      "sentence_index"],
+            self.appr_search_args = dict(
                 tables=["book"],
                 word_id=self.selected_word_id,
                 **self.word_appearance_filters)
-
-            self.word_appr_table.update(
-                values=[(self.db.get_book_title(appr[0])[0],) + appr for appr in appearances]
-            )
+            self.next_appr_page = Page(BookDatabase.APPEARANCES_PAGE_KEYS, WordTab.APPEARANCES_PAGE_SIZE)
+            self._load_word_appr_page()
         else:
-            self.word_appr_table.update(values=[])
+            self.next_appr_page = None
 
         # Check if there where any appearances found
         if self.word_appr_table.TKTreeview.get_children():
@@ -545,6 +626,34 @@ class WordTab(CustomTab):
         else:
             self.book_preview.hide_preview()
 
+    def _load_word_appr_page(self, _value=None):
+        """ Load the next page of the word appearances table, if it wasn't fully loaded """
+        self.requested_pages.discard(WordTab.EventKeys.LOAD_APPR_PAGE)
+        if self.next_appr_page is None:
+            return
+
+        appearances, self.next_appr_page = self.db.search_word_appearances(
+            cols=WordTab.APPEARANCES_COLUMNS,
+            page=self.next_appr_page,
+            **self.appr_search_args)
+        if not appearances:
+            return
+
+        # Updating the table scrolls it to the top and clears its selection, so they are restored
+        tree_view = self.word_appr_table.TKTreeview
+        scroll_position = tree_view.yview()[0]
+        selected_rows = self.word_appr_table.SelectedRows
+
+        self.word_appr_table.update(
+            values=list(self.word_appr_table.Values) +
+            [(self.db.get_book_title(appr[0])[0],) + appr for appr in appearances]
+        )
+
+        tree_view.yview_moveto(scroll_position)
+        if selected_rows:
+            tree_view.selection_set(selected_rows[0] + 1)
+            self.word_appr_table.SelectedRows = selected_rows
+
     def _select_word_appr(self):
         """ Select a word appearance to be highlighted """
         if self.word_appr_table.SelectedRows:
@@ -6,6 +6,8 @@ CREATE TABLE IF NOT EXISTS book (
     author TEXT NOT NULL,
     file_path TEXT NOT NULL UNIQUE,
     file_size INTEGER NOT NULL,
+    file_mtime REAL,
+    file_hash TEXT,
     creation_date DATETIME DEFAULT CURRENT_TIMESTAMP,
     UNIQUE(title, author),
     CHECK(title <> ''),
@@ -13,6 +15,7 @@ CREATE TABLE IF NOT EXISTS book (
     CHECK(file_path <> '')
 );
 
+-- The length of a word is calculated when it is inserted
 CREATE TABLE IF NOT EXISTS word (
     word_id INTEGER NOT NULL PRIMARY KEY,
     name TEXT NOT NULL UNIQUE,
@@ -20,29 +23,58 @@ CREATE TABLE IF NOT EXISTS word (
     CHECK(name <> '')
 );
 
-CREATE TRIGGER IF NOT EXISTS word_length_insertion
-   AFTER INSERT
-   ON word
-   FOR EACH ROW
-BEGIN
-   UPDATE word SET length = LENGTH(name) WHERE word_id = new.word_id;
-END;
-
+-- Clustered by word, since most of the searches are for the appearances of specific words
 CREATE TABLE IF NOT EXISTS word_appearance (
-    word_index INTEGER NOT NULL,
-    book_id INTEGER NOT NULL,
     word_id INTEGER NOT NULL,
+    book_id INTEGER NOT NULL,
+    word_index INTEGER NOT NULL,
     paragraph INTEGER NOT NULL,
     line INTEGER NOT NULL,
     line_index INTEGER NOT NULL,
     line_offset INTEGER NOT NULL,
     sentence INTEGER NOT NULL,
     sentence_index INTEGER NOT NULL,
-    PRIMARY KEY(word_index, book_id, word_id),
+    PRIMARY KEY(word_id, book_id, word_index),
+    FOREIGN KEY(book_id) REFERENCES book,
+    FOREIGN KEY(word_id) REFERENCES word
+) WITHOUT ROWID;
+
+-- Covers reading the words of a book by their order
+CREATE INDEX IF NOT EXISTS word_appearance_book_order
+    ON word_appearance(book_id, word_index, paragraph, sentence, line, line_offset);
+
+-- Covers converting a word location in a sentence to its offset in the book
+CREATE INDEX IF NOT EXISTS word_appearance_location
+    ON word_appearance(book_id, sentence, sentence_index, line, line_offset);
+
+-- The compressed storage of the word appearances, used instead of word_appearance when it is enabled.
+-- All the appearances of a word in a book are stored as a single blob of positions (see db/postings.py)
+CREATE TABLE IF NOT EXISTS word_posting (
+    word_id INTEGER NOT NULL,
+    book_id INTEGER NOT NULL,
+    appearances_count INTEGER NOT NULL,
+    positions BLOB NOT NULL,
+    PRIMARY KEY(word_id, book_id),
     FOREIGN KEY(book_id) REFERENCES book,
     FOREIGN KEY(word_id) REFERENCES word
 );
 
+CREATE INDEX IF NOT EXISTS word_posting_book
+    ON word_posting(book_id);
+
+CREATE TABLE IF NOT EXISTS book_parse_state (
+    book_id INTEGER NOT NULL PRIMARY KEY,
+    file_offset INTEGER NOT NULL,
+    encoding TEXT,
+    words_count INTEGER NOT NULL,
+    paragraph INTEGER NOT NULL,
+    sentence INTEGER NOT NULL,
+    words_in_sentence INTEGER NOT NULL,
+    line INTEGER NOT NULL,
+    previous_line INTEGER,
+    FOREIGN KEY(book_id) REFERENCES book
+);
+
 CREATE TABLE IF NOT EXISTS words_group (
     group_id INTEGER NOT NULL PRIMARY KEY,
     name TEXT NOT NULL UNIQUE,
@@ -70,4 +102,61 @@ CREATE TABLE IF NOT EXISTS word_in_phrase (
     PRIMARY KEY(phrase_id, word_id, phrase_index),
     FOREIGN KEY(phrase_id) REFERENCES phrase,
     FOREIGN KEY(word_id) REFERENCES word
-);
\ No newline at end of file
+);
+
+-- The appearances of the phrases in the books, calculated when a phrase or a book is added
+CREATE TABLE IF NOT EXISTS phrase_match (
+    phrase_id INTEGER NOT NULL,
+    book_id INTEGER NOT NULL,
+    sentence INTEGER NOT NULL,
+    start_index INTEGER NOT NULL,
+    end_index INTEGER NOT NULL,
+    PRIMARY KEY(phrase_id, book_id, sentence, start_index),
+    FOREIGN KEY(phrase_id) REFERENCES phrase,
+    FOREIGN KEY(book_id) REFERENCES book
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS phrase_match_book
+    ON phrase_match(book_id);
+
+-- Aggregates of the word appearances of every book, calculated when the appearances of the book are inserted
+CREATE TABLE IF NOT EXISTS book_statistics (
+    book_id INTEGER NOT NULL PRIMARY KEY,
+    words_count INTEGER NOT NULL,
+    unique_words_count INTEGER NOT NULL,
+    letters_count INTEGER NOT NULL,
+    paragraphs_count INTEGER NOT NULL,
+    lines_count INTEGER NOT NULL,
+    sentences_count INTEGER NOT NULL,
+    FOREIGN KEY(book_id) REFERENCES book
+);
+
+-- The distinct words of every book, so the books containing some words are found without reading their appearances.
+-- It is updated together with the books statistics, in both storage modes.
+CREATE TABLE IF NOT EXISTS book_word (
+    word_id INTEGER NOT NULL,
+    book_id INTEGER NOT NULL,
+    PRIMARY KEY(word_id, book_id),
+    FOREIGN KEY(book_id) REFERENCES book,
+    FOREIGN KEY(word_id) REFERENCES word
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS book_word_book
+    ON book_word(book_id);
+
+-- The trigrams of the searchable texts (word names, book titles and authors), inserted together with the texts.
+-- The source is the indexed column, as numbered in db/trigrams.py, and object_id is the id of the text row.
+CREATE TABLE IF NOT EXISTS text_trigram (
+    source INTEGER NOT NULL,
+    trigram TEXT NOT NULL,
+    object_id INTEGER NOT NULL,
+    PRIMARY KEY(source, trigram, object_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS setting (
+    name TEXT NOT NULL PRIMARY KEY,
+    value
+);
+
+-- Must be updated together with BookDatabase.SCHEMA_VERSION
+PRAGMA user_version = 7;
\ No newline at end of file
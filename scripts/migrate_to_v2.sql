@@ -0,0 +1,54 @@
+-- This file upgrades a books database from schema version 1 (the original schema) to schema version 2.
+-- The new columns of the book table are added before this script runs.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS book_parse_state (
+    book_id INTEGER NOT NULL PRIMARY KEY,
+    file_offset INTEGER NOT NULL,
+    encoding TEXT,
+    words_count INTEGER NOT NULL,
+    paragraph INTEGER NOT NULL,
+    sentence INTEGER NOT NULL,
+    words_in_sentence INTEGER NOT NULL,
+    line INTEGER NOT NULL,
+    previous_line INTEGER,
+    FOREIGN KEY(book_id) REFERENCES book
+);
+
+-- The length of the words is calculated on insertion now
+DROP TRIGGER IF EXISTS word_length_insertion;
+
+-- Rebuild the appearances table, clustered by word
+CREATE TABLE word_appearance_v2 (
+    word_id INTEGER NOT NULL,
+    book_id INTEGER NOT NULL,
+    word_index INTEGER NOT NULL,
+    paragraph INTEGER NOT NULL,
+    line INTEGER NOT NULL,
+    line_index INTEGER NOT NULL,
+    line_offset INTEGER NOT NULL,
+    sentence INTEGER NOT NULL,
+    sentence_index INTEGER NOT NULL,
+    PRIMARY KEY(word_id, book_id, word_index),
+    FOREIGN KEY(book_id) REFERENCES book,
+    FOREIGN KEY(word_id) REFERENCES word
+) WITHOUT ROWID;
+
+INSERT INTO word_appearance_v2(word_id, book_id, word_index, paragraph, line, line_index, line_offset,
+                               sentence, sentence_index)
+SELECT word_id, book_id, word_index, paragraph, line, line_index, line_offset, sentence, sentence_index
+FROM word_appearance;
+
+DROP TABLE word_appearance;
+ALTER TABLE word_appearance_v2 RENAME TO word_appearance;
+
+CREATE INDEX word_appearance_book_order
+    ON word_appearance(book_id, word_index, paragraph, sentence, line, line_offset);
+
+CREATE INDEX word_appearance_location
+    ON word_appearance(book_id, sentence, sentence_index, line, line_offset);
+
+PRAGMA user_version = 2;
+
+COMMIT;
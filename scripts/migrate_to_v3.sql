@@ -0,0 +1,27 @@
+-- This file upgrades a books database from schema version 2 to schema version 3.
+
+BEGIN;
+
+-- The compressed storage of the word appearances, used instead of word_appearance when it is enabled.
+-- All the appearances of a word in a book are stored as a single blob of positions (see db/postings.py)
+CREATE TABLE IF NOT EXISTS word_posting (
+    word_id INTEGER NOT NULL,
+    book_id INTEGER NOT NULL,
+    appearances_count INTEGER NOT NULL,
+    positions BLOB NOT NULL,
+    PRIMARY KEY(word_id, book_id),
+    FOREIGN KEY(book_id) REFERENCES book,
+    FOREIGN KEY(word_id) REFERENCES word
+);
+
+CREATE INDEX IF NOT EXISTS word_posting_book
+    ON word_posting(book_id);
+
+CREATE TABLE IF NOT EXISTS setting (
+    name TEXT NOT NULL PRIMARY KEY,
+    value
+);
+
+PRAGMA user_version = 3;
+
+COMMIT;
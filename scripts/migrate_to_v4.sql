@@ -0,0 +1,23 @@
+-- This file upgrades a books database from schema version 3 to schema version 4.
+-- The phrase matches are calculated by BookDatabase after this script runs.
+
+BEGIN;
+
+-- The appearances of the phrases in the books, calculated when a phrase or a book is added
+CREATE TABLE IF NOT EXISTS phrase_match (
+    phrase_id INTEGER NOT NULL,
+    book_id INTEGER NOT NULL,
+    sentence INTEGER NOT NULL,
+    start_index INTEGER NOT NULL,
+    end_index INTEGER NOT NULL,
+    PRIMARY KEY(phrase_id, book_id, sentence, start_index),
+    FOREIGN KEY(phrase_id) REFERENCES phrase,
+    FOREIGN KEY(book_id) REFERENCES book
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS phrase_match_book
+    ON phrase_match(book_id);
+
+PRAGMA user_version = 4;
+
+COMMIT;
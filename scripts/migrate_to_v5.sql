@@ -0,0 +1,20 @@
+-- This file upgrades a books database from schema version 4 to schema version 5.
+-- The statistics of the books are calculated by BookDatabase after this script runs.
+
+BEGIN;
+
+-- Aggregates of the word appearances of every book, calculated when the appearances of the book are inserted
+CREATE TABLE IF NOT EXISTS book_statistics (
+    book_id INTEGER NOT NULL PRIMARY KEY,
+    words_count INTEGER NOT NULL,
+    unique_words_count INTEGER NOT NULL,
+    letters_count INTEGER NOT NULL,
+    paragraphs_count INTEGER NOT NULL,
+    lines_count INTEGER NOT NULL,
+    sentences_count INTEGER NOT NULL,
+    FOREIGN KEY(book_id) REFERENCES book
+);
+
+PRAGMA user_version = 5;
+
+COMMIT;
@@ -0,0 +1,17 @@
+-- This file upgrades a books database from schema version 5 to schema version 6.
+-- The trigrams of the existing texts are inserted by BookDatabase after this script runs.
+
+BEGIN;
+
+-- The trigrams of the searchable texts (word names, book titles and authors), inserted together with the texts.
+-- The source is the indexed column, as numbered in db/trigrams.py, and object_id is the id of the text row.
+CREATE TABLE IF NOT EXISTS text_trigram (
+    source INTEGER NOT NULL,
+    trigram TEXT NOT NULL,
+    object_id INTEGER NOT NULL,
+    PRIMARY KEY(source, trigram, object_id)
+) WITHOUT ROWID;
+
+PRAGMA user_version = 6;
+
+COMMIT;
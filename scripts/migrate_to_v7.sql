@@ -0,0 +1,21 @@
+-- This file upgrades a books database from schema version 6 to schema version 7.
+-- The words of the existing books are inserted by BookDatabase after this script runs.
+
+BEGIN;
+
+-- The distinct words of every book, so the books containing some words are found without reading their appearances.
+-- It is updated together with the books statistics, in both storage modes.
+CREATE TABLE IF NOT EXISTS book_word (
+    word_id INTEGER NOT NULL,
+    book_id INTEGER NOT NULL,
+    PRIMARY KEY(word_id, book_id),
+    FOREIGN KEY(book_id) REFERENCES book,
+    FOREIGN KEY(word_id) REFERENCES word
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS book_word_book
+    ON book_word(book_id);
+
+PRAGMA user_version = 7;
+
+COMMIT;
@@ -1,14 +1,66 @@
+import array
 import itertools
+import multiprocessing
 import os
 import re
 
 from utils.constants import VALID_WORD_REGEX
-from utils.utils import cached_read
+from utils.utils import iter_lines, bounded_imap
 
 AUTHOR_REGEX = r"Author: (.+)$"
 TITLE_REGEX = r"Title: (.+)$"
 END_OF_SENTENCE_REGEX = r"[\.?!]"
 
+# Matches the words and the ends of sentences in a line, in a single scan
+TOKEN_PATTERN = re.compile(rf"(?P<word>{VALID_WORD_REGEX})|{END_OF_SENTENCE_REGEX}")
+
+# The minimal number of lines in a segment of a book which is parsed in parallel
+SEGMENT_MIN_LINES = 20000
+
+# The number of segments which can wait for stitching in parse_book_parallel, per worker process
+PENDING_SEGMENTS_PER_PROCESS = 2
+
+# The number of appearances in each batch of parse_book_batches
+BATCH_SIZE = 64 * 1024
+
+# The array type code of the appearances columns (signed 64 bit integers)
+COLUMN_TYPECODE = "q"
+
+# The number of the number columns of an appearance (all but the word)
+APPEARANCE_COLUMNS = 7
+
+
+class AppearancesBatch:
+    """
+    A batch of word appearances stored in columns.
+    The numbers are kept in compact arrays, instead of a python tuple for every appearance.
+    """
+
+    def __init__(self, words, columns):
+        """
+        :param words: Sequence of the words strings
+        :param columns: Arrays of the word_index, paragraph, line, line_index, line_offset,
+            sentence, and sentence_index of the appearances, in this order
+        """
+        self.words = words
+        self.columns = columns
+
+    @classmethod
+    def empty(cls):
+        """
+        :return: New batch without appearances, which the columns can be appended to
+        """
+        return cls([], [array.array(COLUMN_TYPECODE) for _column in range(APPEARANCE_COLUMNS)])
+
+    def appenders(self):
+        """
+        :return: The bound append methods of the words and of the columns, in the order of an appearance
+        """
+        return (self.words.append,) + tuple(column.append for column in self.columns)
+
+    def __len__(self):
+        return len(self.words)
+
 
 def parse_book_file(path):
     """
@@ -22,7 +74,7 @@ def parse_book_file(path):
     author_match = None
 
     # Iterate over the lines and search for the title and author
-    for line in cached_read(path).splitlines():
+    for line in iter_lines(path):
         if not title_match:
             title_match = re.search(TITLE_REGEX, line)
         if not author_match:
@@ -39,11 +91,176 @@ def parse_book_file(path):
     return title, author, date, size
 
 
+class BookParser:
+    """
+    Stateful parser of book lines into word appearances.
+    All the counters are carried between calls to parse_lines,
+    so a book can be fed to the parser line by line instead of all at once.
+    """
+
+    def __init__(self, words_count=0, paragraph=0, sentence=0, words_in_sentence=0, line=0, previous_line=None):
+        """
+        The default arguments are the state at the start of a book.
+        Pass the counters of another parser to continue its parsing.
+        """
+        self.words_count = words_count  # The number of words parsed so far
+        self.paragraph = paragraph  # The current paragraph number
+        self.sentence = sentence  # The current sentence number
+        self.words_in_sentence = words_in_sentence  # The number of words parsed so far in the current sentence
+        self.line = line  # The number of lines parsed so far
+        self.previous_line = previous_line  # The last line which contained words
+
+    def parse_lines(self, lines):
+        """
+        Generator of word appearances in the given lines.
+        The appearances are in the same form as the ones yielded by parse_book.
+        :param lines: Iterable of the following lines of the book, without the line endings
+        """
+        for batch in self.parse_lines_batches(lines):
+            yield from zip(batch.words, *batch.columns)
+
+    def parse_lines_batches(self, lines, batch_size=BATCH_SIZE):
+        """
+        Generator of the word appearances in the given lines, in batches stored in columns.
+        Every appearance is appended straight into the columns of its batch, without a tuple per appearance.
+        :param lines: Iterable of the following lines of the book, without the line endings
+        :param batch_size: The number of appearances after which a batch is ended, at the end of the current line
+        :return: Generator of AppearancesBatch objects
+        """
+        # Use local variables in the loop for performance, and store them back at the end of every line
+        words_count = self.words_count
+        paragraph = self.paragraph
+        sentence = self.sentence
+        words_in_sentence = self.words_in_sentence
+        line_number = self.line
+        previous_line = self.previous_line
+
+        # The bound append methods of the columns of the current batch
+        batch = AppearancesBatch.empty()
+        (append_word, append_word_index, append_paragraph, append_line, append_line_index, append_line_offset,
+         append_sentence, append_sentence_index) = batch.appenders()
+        batch_end = words_count + batch_size  # The words count at which the batch is full
+
+        for line in lines:
+            line_number += 1
+            words_in_line = 0
+
+            # The line is made of parts separated by ends of sentences.
+            # Every part that isn't empty, except the first one in the line, starts a new sentence.
+            parts_count = 0  # The number of not empty parts started in the line
+            part_start = 0  # The start of the current part
+            part_counted = False  # Was the current part already counted as not empty
+            empty_parts = 0  # The number of empty parts, which aren't counted in the offsets
+
+            for token in TOKEN_PATTERN.finditer(line):
+                token_start = token.start()
+                is_word = token.lastgroup is not None
+
+                # The part is not empty if there is anything before the token, or if the token is a word
+                if not part_counted and (is_word or token_start > part_start):
+                    part_counted = True
+                    parts_count += 1
+                    if parts_count > 1:
+                        words_in_sentence = 0
+                        sentence += 1
+
+                if is_word:
+                    # If this is the first word in the line, check if the last line with words wasn't the previous line
+                    if previous_line != line_number:
+                        if previous_line is None or previous_line < line_number - 1:
+                            paragraph += 1
+
+                            # If the last sentence wasn't ended by a dot '.', we should start a new sentence manually
+                            if words_in_sentence > 0:
+                                words_in_sentence = 0
+                                sentence += 1
+
+                        previous_line = line_number
+
+                    words_count += 1
+                    words_in_sentence += 1
+                    words_in_line += 1
+
+                    append_word(token[0].lower())
+                    append_word_index(words_count)
+                    append_paragraph(paragraph)
+                    append_line(line_number)
+                    append_line_index(words_in_line)
+                    append_line_offset(token_start - empty_parts)
+                    append_sentence(sentence)
+                    append_sentence_index(words_in_sentence)
+                else:
+                    # An end of a sentence, start the next part
+                    if not part_counted:
+                        empty_parts += 1
+                    part_start = token_start + 1
+                    part_counted = False
+
+            # Check if the last part of the line starts a new sentence
+            if not part_counted and len(line) > part_start and parts_count > 0:
+                words_in_sentence = 0
+                sentence += 1
+
+            self.words_count = words_count
+            self.paragraph = paragraph
+            self.sentence = sentence
+            self.words_in_sentence = words_in_sentence
+            self.line = line_number
+            self.previous_line = previous_line
+
+            # Batches are cut at the ends of lines, so the parser state always matches the yielded appearances
+            if words_count >= batch_end:
+                yield batch
+                batch = AppearancesBatch.empty()
+                (append_word, append_word_index, append_paragraph, append_line, append_line_index, append_line_offset,
+                 append_sentence, append_sentence_index) = batch.appenders()
+                batch_end = words_count + batch_size
+
+        if batch:
+            yield batch
+
+    def stitch_segment(self, segment, appearances):
+        """
+        Continue the parsing with a segment of the book that was parsed by a separate parser.
+        The segment must start right after an empty line, and be parsed by a new parser.
+        :param segment: The parser that parsed the segment, in its state at the end of the segment
+        :param appearances: List of the appearances yielded by the segment parser
+        :return: Generator of the segment appearances, with the counters of this parser
+        """
+        words_shift = self.words_count
+        paragraph_shift = self.paragraph
+        line_shift = self.line
+
+        # If the first word in the segment isn't preceded by the end of a sentence, the segment parser
+        # didn't know that there is an open sentence (if any) that should be ended by the new paragraph
+        if appearances and appearances[0][6] == 0 and self.words_in_sentence > 0:
+            sentence_shift = self.sentence + 1
+        else:
+            sentence_shift = self.sentence
+
+        # Update the counters to the end of the segment
+        self.words_count += segment.words_count
+        self.paragraph += segment.paragraph
+        self.line += segment.line
+        self.sentence = segment.sentence + sentence_shift
+        if segment.words_count > 0 or segment.sentence > 0:
+            # The segment started a new sentence, so its words counter is the correct one
+            self.words_in_sentence = segment.words_in_sentence
+        if segment.previous_line is not None:
+            self.previous_line = segment.previous_line + line_shift
+
+        return ((word, word_index + words_shift, paragraph + paragraph_shift, line + line_shift,
+                 line_index, line_offset, sentence + sentence_shift, sentence_index)
+                for word, word_index, paragraph, line, line_index, line_offset, sentence, sentence_index
+                in appearances)
+
+
 def parse_book(path):
     """
     Generator of word appearances in the path file.
+    The file is read line by line, so the memory usage depends on the longest line and not on the book size.
     This yields appearances in the form of tuples containing:
-        word: The word string
+        word: The word string, in lower case
         word_index: The index of the word in the book
         paragraph: The paragraph number
         line: The line number
@@ -54,56 +271,83 @@ def parse_book(path):
 
     :param path: The path of the file to parse
     """
-    words_counter = itertools.count(1)
-    paragraph_counter = 0
-    sentence_counter = 0
-    words_in_sentence = 0
-    previous_line = None
-
-    # Go over the lines in the file
-    raw = cached_read(path)
-    for line_counter, line in enumerate(raw.splitlines(), 1):
-        # Split each line to the different sentences
-        words_in_line_counter = itertools.count(1)
-        sentence_offset_in_line = 0
-
-        # The filter remove empty sentences
-        for sentence_number, sentence in enumerate(filter(None, re.split(END_OF_SENTENCE_REGEX, line))):
-            if sentence_number > 0:
-                # If its not the first sentence we parse in the line, start a new sentence
-                words_in_sentence = 0
-                sentence_counter += 1
+    yield from BookParser().parse_lines(iter_lines(path))
 
-            # Get the list of the words matches
-            words_match = list(re.finditer(VALID_WORD_REGEX, sentence))
 
-            # Check if there are words in this line
-            if words_match:
-                # If the last line with words wasn't the previous line
-                if previous_line is None or previous_line < line_counter - 1:
-                    paragraph_counter += 1
+def split_book(path, min_lines=SEGMENT_MIN_LINES):
+    """
+    Split the lines of a book file to segments which can be parsed separately.
+    Each segment (except the first) starts right after an empty line, which means it starts a new paragraph.
+    :param path: The path of the file to split
+    :param min_lines: The minimal number of lines in each segment (except the last)
+    :return: Generator of the segments, as lists of lines
+    """
+    segment = []
+    for line in iter_lines(path):
+        segment.append(line)
+        if len(segment) >= min_lines and not line.strip():
+            yield segment
+            segment = []
 
-                    # If the last sentence wasn't ended by a dot '.', we should start a new sentence manually
-                    if words_in_sentence > 0:
-                        words_in_sentence = 0
-                        sentence_counter += 1
+    if segment:
+        yield segment
 
-                previous_line = line_counter
 
-                # Go over the matched words and insert them to the database
-                for word_match in words_match:
-                    word = word_match[0]
-                    words_in_sentence += 1
-                    line_offset = sentence_offset_in_line + word_match.start()
-
-                    yield (word,
-                           next(words_counter),
-                           paragraph_counter,
-                           line_counter,
-                           next(words_in_line_counter),
-                           line_offset,
-                           sentence_counter,
-                           words_in_sentence)
-
-            # Add the length of the line to the total offset counter
-            sentence_offset_in_line += len(sentence) + 1
+def _parse_segment(lines):
+    """
+    Parse a segment of a book with a new parser.
+    Used by the worker processes of parse_book_parallel.
+    :param lines: The lines of the segment
+    :return: The segment parser at the end of the segment, and the list of the appearances in the segment
+    """
+    segment = BookParser()
+    appearances = list(segment.parse_lines(lines))
+    return segment, appearances
+
+
+def parse_book_parallel(path, processes=None, min_lines=SEGMENT_MIN_LINES):
+    """
+    Generator of word appearances in the path file, parsed by a pool of worker processes.
+    The book is split into segments at empty lines, and the parsed segments are stitched back together,
+    so the appearances are exactly the same as the ones yielded by parse_book.
+    :param path: The path of the file to parse
+    :param processes: The number of worker processes. Keep as None to use the number of CPUs.
+    :param min_lines: The minimal number of lines in each segment
+    """
+    processes = processes or os.cpu_count()
+    parser = BookParser()
+
+    with multiprocessing.Pool(processes) as pool:
+        parsed_segments = bounded_imap(pool, _parse_segment, split_book(path, min_lines),
+                                       PENDING_SEGMENTS_PER_PROCESS * processes)
+        for segment, appearances in parsed_segments:
+            yield from parser.stitch_segment(segment, appearances)
+
+
+def batch_appearances(appearances, batch_size=BATCH_SIZE):
+    """
+    Group word appearances to batches stored in columns.
+    :param appearances: Iterable of appearances, as yielded by parse_book
+    :param batch_size: The maximal number of appearances in each batch
+    :return: Generator of AppearancesBatch objects
+    """
+    appearances = iter(appearances)
+    while True:
+        chunk = list(itertools.islice(appearances, batch_size))
+        if not chunk:
+            return
+
+        # Transpose the chunk of appearances to columns
+        words, *columns = zip(*chunk)
+        yield AppearancesBatch(words, [array.array(COLUMN_TYPECODE, column) for column in columns])
+
+
+def parse_book_batches(path, batch_size=BATCH_SIZE):
+    """
+    Generator of word appearances in the path file, in batches stored in columns.
+    The appearances are parsed straight into the columns, without a python tuple for every appearance.
+    :param path: The path of the file to parse
+    :param batch_size: The number of appearances after which a batch is ended, at the end of the current line
+    :return: Generator of AppearancesBatch objects
+    """
+    yield from BookParser().parse_lines_batches(iter_lines(path), batch_size)
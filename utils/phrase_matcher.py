@@ -0,0 +1,87 @@
+"""
+This file contains the multi-phrase matcher, used to search many phrases in a single pass over the words of a book.
+"""
+
+import collections
+
+# The state of the matcher before any word was matched
+ROOT_STATE = 0
+
+
+class PhraseMatcher:
+    """
+    Aho-Corasick automaton over sequences of word ids.
+    It finds all the appearances of all the phrases in a sequence of words, by reading every word once.
+    """
+
+    def __init__(self, phrases):
+        """
+        :param phrases: Dict that maps the phrase ids to the sequences of their word ids
+        """
+        self._transitions = [{}]  # Maps every state to its next states by word id
+        self._failures = [ROOT_STATE]  # The longest proper suffix of every state, which is a state as well
+        self._outputs = [[]]  # The phrases that end in every state, as (phrase_id, words_count) pairs
+
+        for phrase_id, word_ids in phrases.items():
+            self._add_phrase(phrase_id, tuple(word_ids))
+        self._build_failures()
+
+    def _add_phrase(self, phrase_id, word_ids):
+        """
+        Add the states of a phrase to the trie of the automaton.
+        :param phrase_id: The phrase id of the phrase
+        :param word_ids: The word ids of the phrase
+        """
+        if not word_ids:
+            return
+
+        state = ROOT_STATE
+        for word_id in word_ids:
+            next_state = self._transitions[state].get(word_id)
+            if next_state is None:
+                next_state = len(self._transitions)
+                self._transitions.append({})
+                self._failures.append(ROOT_STATE)
+                self._outputs.append([])
+                self._transitions[state][word_id] = next_state
+            state = next_state
+
+        self._outputs[state].append((phrase_id, len(word_ids)))
+
+    def _build_failures(self):
+        """ Calculate the failure of every state, by the order of their depth in the trie. """
+        states = collections.deque(self._transitions[ROOT_STATE].values())
+        while states:
+            state = states.popleft()
+            for word_id, next_state in self._transitions[state].items():
+                states.append(next_state)
+
+                # The failure of the next state is the longest suffix that can continue with the same word
+                failure = self._failures[state]
+                while failure != ROOT_STATE and word_id not in self._transitions[failure]:
+                    failure = self._failures[failure]
+                failure = self._transitions[failure].get(word_id, ROOT_STATE)
+
+                self._failures[next_state] = failure
+                self._outputs[next_state] += self._outputs[failure]
+
+    def match(self, word_ids):
+        """
+        Find the appearances of all the phrases in a sequence of words.
+        :param word_ids: Iterable of word ids
+        :return: Generator of the appearances, as (phrase_id, start_index, end_index) tuples,
+            where the indexes are of the words in the sequence, starting from 1.
+            The appearances are ordered by their end index.
+        """
+        transitions = self._transitions
+        failures = self._failures
+        outputs = self._outputs
+
+        state = ROOT_STATE
+        for index, word_id in enumerate(word_ids, start=1):
+            while state != ROOT_STATE and word_id not in transitions[state]:
+                state = failures[state]
+            state = transitions[state].get(word_id, ROOT_STATE)
+
+            for phrase_id, words_count in outputs[state]:
+                yield phrase_id, index - words_count + 1, index
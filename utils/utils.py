@@ -3,13 +3,19 @@ This file contains general utility functions used in multiple places.
 """
 
 import codecs
+import collections
 import functools
+import hashlib
+import locale
 import math
 import time
 
 # The encoding list to iterate over when trying to open a file
 ENCODINGS = "utf-8", None
 
+# The size of the chunks used when reading a file incrementally
+READ_CHUNK_SIZE = 1024 * 1024
+
 # The name of the different file sizes
 FILE_SIZES = ("Bytes", "KB", "MB", "GB", "TB", "PB", "EB", "ZB", "YB")
 
@@ -35,6 +41,112 @@ def cached_read(filename):
     raise UnicodeDecodeError
 
 
+def find_encoding(filename):
+    """
+    Find the first encoding from ENCODINGS that can decode the whole file.
+    The file is decoded in chunks, so the memory usage doesn't depend on the file size.
+    :param filename: The filename to check
+    :raises UnicodeDecodeError: If failed to decode the file with all tried encodings
+    :return: The encoding to open the file with
+    """
+    for encoding in ENCODINGS:
+        decoder = codecs.getincrementaldecoder(encoding or locale.getpreferredencoding(False))()
+        try:
+            with open(filename, "rb") as file:
+                for chunk in iter(functools.partial(file.read, READ_CHUNK_SIZE), b""):
+                    decoder.decode(chunk)
+                decoder.decode(b"", final=True)
+            return encoding
+        except UnicodeDecodeError:
+            # Continue to next encoding
+            pass
+
+    # No encoding was found
+    raise UnicodeDecodeError
+
+
+def iter_lines(filename):
+    """
+    Lazily iterate over the lines of a file, without reading the whole file into memory.
+    The lines are split exactly as str.splitlines would split the whole content of the file.
+    :param filename: The filename to read
+    :raises UnicodeDecodeError: If failed to open the file with all tried encodings
+    :return: Generator of the lines, without the line endings
+    """
+    with open(filename, "r", encoding=find_encoding(filename), newline="") as file:
+        for raw_line in file:
+            # The file object only splits on '\r' and '\n', so split on the other line boundaries as well
+            yield from raw_line.splitlines()
+
+
+class CompleteLinesReader:
+    """
+    Iterable of the complete lines of a file, starting from a given byte offset.
+    A line is complete only once its line break was written, so a line which is still being written isn't read.
+    After the iteration, the offset attribute points right after the last line read,
+    so the next reader can continue from there when the file grows.
+    The lines are split exactly as iter_lines would split them.
+    """
+
+    def __init__(self, filename, offset=0, encoding=ENCODINGS[0]):
+        """
+        :param filename: The filename to read
+        :param offset: The byte offset to start reading from. Must be at the start of a line.
+        :param encoding: The encoding of the file, None for the default encoding
+        """
+        self.filename = filename
+        self.offset = offset
+        self.encoding = encoding or locale.getpreferredencoding(False)
+
+    def __iter__(self):
+        with open(self.filename, "rb") as file:
+            file.seek(self.offset)
+            for raw_line in file:
+                # Stop at the last line, if it isn't complete yet
+                if not raw_line.endswith(b"\n"):
+                    break
+
+                yield from raw_line.decode(self.encoding).splitlines()
+                self.offset += len(raw_line)
+
+
+def file_hash(filename):
+    """
+    Calculate the hash of the content of a file.
+    The file is read in chunks, so the memory usage doesn't depend on the file size.
+    :param filename: The filename to hash
+    :return: The hash as a hex string
+    """
+    file_hash_obj = hashlib.sha1()
+    with open(filename, "rb") as file:
+        for chunk in iter(functools.partial(file.read, READ_CHUNK_SIZE), b""):
+            file_hash_obj.update(chunk)
+
+    return file_hash_obj.hexdigest()
+
+
+def bounded_imap(pool, func, iterable, max_pending):
+    """
+    Lazily apply a function on the items of an iterable using a pool of processes, keeping the results order.
+    Unlike Pool.imap, at most max_pending items are taken from the iterable before their results are consumed,
+    so the memory usage doesn't depend on the speed of the consumer.
+    :param pool: The multiprocessing pool to use
+    :param func: The function to apply, must be picklable
+    :param iterable: The items to apply the function on
+    :param max_pending: The maximal number of items which can be processed at once
+    :return: Generator of the results
+    """
+    pending = collections.deque()
+    for item in iterable:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+
+    # Wait for the rest of the results
+    while pending:
+        yield pending.popleft().get()
+
+
 def float_to_str(number, ndigits=2):
     """
     Round a float and convert it to a string with commas.